@@ -0,0 +1,9 @@
+"""
+Benchmarks of tablereport.
+
+Run all the stages on synthetic reports of 1k, 100k and 1M rows, and compare
+them with a saved baseline::
+
+    python -m benchmarks --save baseline.json
+    python -m benchmarks --baseline baseline.json --sizes 1000,100000
+"""
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import argparse
+import sys
+
+from . import reports, runner
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--sizes', default=','.join(map(str, reports.SIZES)),
+                        help='comma separated numbers of rows')
+    parser.add_argument('--stages', default=None,
+                        help='comma separated stages, from {}'.format(
+                            ', '.join(name for name, _, _ in
+                                      reports.STAGES)))
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a baseline')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='ratio to the baseline reported as a regression')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    stages = args.stages.split(',') if args.stages else None
+    results = runner.run(sizes, stages)
+
+    if args.save:
+        runner.save(results, args.save)
+    if args.baseline:
+        print()
+        regressions = runner.compare(results, runner.load(args.baseline),
+                                     args.threshold)
+        for rows, stage, key in regressions:
+            print('regression: {} {} ({})'.format(rows, stage, key))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
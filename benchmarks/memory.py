@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Compare the memory used by the cells of a large table with the memory they
+would use as plain objects with a ``__dict__``, and fail if they don't use
+less than half of it::
+
+    python -m benchmarks.memory [rows]
+"""
+from __future__ import print_function, unicode_literals
+
+import gc
+import sys
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from tablereport import Table
+from tablereport.style import _default_style
+
+from .reports import make_body, make_header
+
+# the smallest reduction of the memory used by the cells
+TARGET = 0.5
+
+
+class DictCell(object):
+    """a cell with the layout of the cells before they had ``__slots__``"""
+
+    def __init__(self, value, style=None, width=1, height=1):
+        self.value = value
+        self.width = width
+        self.height = height
+        if style is None:
+            style = _default_style
+        self.style = style
+
+
+def measure(func):
+    gc.collect()
+    if tracemalloc is None:
+        result = func()
+        return result, _size(result)
+    tracemalloc.start()
+    result = func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def _size(result):
+    """the size of the rows and cells of a table or of a list of rows"""
+    if isinstance(result, Table):
+        blocks = result._data.blocks
+        size = sys.getsizeof(blocks) + sum(map(sys.getsizeof, blocks))
+        rows = result._data
+    else:
+        size = sys.getsizeof(result)
+        rows = result
+    for row in rows:
+        size += sys.getsizeof(row)
+        for cell in row:
+            if cell is None:
+                continue
+            size += sys.getsizeof(cell)
+            if hasattr(cell, '__dict__'):
+                size += sys.getsizeof(cell.__dict__)
+    return size
+
+
+def _dict_cells(body):
+    """wrap the values of ``body`` into ``DictCell`` in place"""
+    for row in body:
+        for col_num, value in enumerate(row):
+            row[col_num] = DictCell(value)
+    return body
+
+
+def main(rows=100000):
+    # both tables wrap the values of the rows given in place, so that only
+    # the cells are measured, and not copies of the rows
+    header, body = make_header(), make_body(rows)
+    table, slots_size = measure(lambda: Table(header=header, body=body,
+                                              copy=False))
+    del table
+    body = make_body(rows)
+    cells, dict_size = measure(lambda: _dict_cells(body))
+    del cells
+
+    reduction = 1 - slots_size / float(dict_size)
+    print('{} rows x 5 columns'.format(rows))
+    print('cells with __dict__:  {:8.1f} MB'.format(dict_size / 2.0 ** 20))
+    print('cells with __slots__: {:8.1f} MB'.format(slots_size / 2.0 ** 20))
+    print('reduction:            {:8.1%}'.format(reduction))
+    if reduction <= TARGET:
+        print('the reduction is below the target of {:.0%}'.format(TARGET))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
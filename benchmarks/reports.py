@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Synthetic sales reports, and the stages of making them.
+
+Each stage is a function taking the state left by the previous stages (a
+dict) and updating it, so that only the work of the stage itself is timed.
+"""
+from __future__ import unicode_literals
+
+import os
+
+from openpyxl import Workbook
+
+from tablereport import (Table, Style, ColumnSelector, RowSelector,
+                         CellSelector, WorkSheetWriter)
+from tablereport.shortcut import write_to_excel
+
+SIZES = (1000, 100000, 1000000)
+
+table_style = Style({
+    'horizontal_align': 'center',
+    'vertical_align': 'center',
+    'font_size': 12,
+    'height': 'auto',
+    'width': 'auto',
+})
+title_style = Style({
+    'font_size': 15,
+    'background_color': 'FF87CEFA',
+    'font_weight': 'blod'
+}, extend=table_style)
+header_style = Style({
+    'background_color': 'FF87CEFA',
+}, extend=table_style)
+even_row_style = Style({
+    'background_color': 'FFF0F0F0',
+}, extend=table_style)
+large_amount_style = Style({
+    'background_color': 'ff00cc33',
+}, extend=table_style)
+total_style = Style({
+    'background_color': 'ffe6e6e6',
+}, extend=table_style)
+
+
+def make_header():
+    """a title and a two level header, spanned by ``None``"""
+    return [[('Sales report', title_style), None, None, None, None],
+            [('Region', header_style), ('Product', header_style),
+             ('Sales', header_style), None, None],
+            [None, None, ('Day', header_style), ('Quantity', header_style),
+             ('Amount', header_style)]]
+
+
+def make_body(rows):
+    """rows sorted by region (10 of them) and product (20 per region)"""
+    return [['Region {:02d}'.format(i * 10 // rows),
+             'Product {:03d}'.format(i * 200 // rows),
+             i % 365, i % 7, i * 0.5] for i in range(rows)]
+
+
+def prepare(state):
+    state['header'] = make_header()
+    state['body'] = make_body(state['rows'])
+
+
+def construct(state):
+    state['table'] = Table(header=state.pop('header'),
+                           body=state.pop('body'), style=table_style)
+
+
+def group_merge_summary(state):
+    table = state['table']
+    table.body.select(ColumnSelector(lambda col: col == 2)).group().merge()
+    regions = table.body.select(ColumnSelector(lambda col: col == 1))
+    regions.group().merge().left.summary(label_span=1, label='Region total',
+                                         label_style=total_style,
+                                         value_style=total_style)
+    table.summary(label_span=2, label='Total', label_style=total_style,
+                  value_style=total_style)
+
+
+def select(state):
+    table = state['table']
+    table.body.select(RowSelector(lambda row: not row % 2)).set_style(
+        even_row_style)
+    amounts = table.body.select(ColumnSelector(lambda col: col == 5)).one()
+    threshold = state['rows'] * 0.4
+    amounts.select(CellSelector(lambda cell: cell.value > threshold)) \
+        .set_style(large_amount_style)
+
+
+def export(state):
+    write_to_excel(os.path.join(state['directory'], 'write_only.xlsx'),
+                   state['table'], write_only=True)
+
+
+def export_xml(state):
+    write_to_excel(os.path.join(state['directory'], 'xml.xlsx'),
+                   state['table'], engine='xml')
+
+
+def export_worksheet(state):
+    workbook = Workbook()
+    WorkSheetWriter.write(workbook.active, state['table'], (0, 0))
+    workbook.save(os.path.join(state['directory'], 'worksheet.xlsx'))
+
+
+# (name, function, largest number of rows or None)
+# the whole worksheet of a 1M rows table does not fit in a reasonable amount
+# of memory, so it is only exported in write-only mode
+STAGES = (
+    ('construct', construct, None),
+    ('group_merge_summary', group_merge_summary, None),
+    ('select', select, None),
+    ('export', export, None),
+    ('export_xml', export_xml, None),
+    ('export_worksheet', export_worksheet, 100000),
+)
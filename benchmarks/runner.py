@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Run the stages of ``reports`` and compare the results with a baseline.
+
+Results are ``{rows: {stage: {'seconds': ..., 'peak_mb': ...}}}``, where the
+peak is the largest amount of memory used during the stage on top of what was
+used before it, or None if it cannot be measured on the platform.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from . import reports
+
+_STATM = '/proc/self/statm'
+
+# differences to the baseline smaller than these are noise, not regressions
+_NOISE = {'seconds': 0.1, 'peak_mb': 1.0}
+
+
+class _PeakSampler(threading.Thread):
+    """
+    Sample the resident memory of the process while a stage runs. Unlike
+    tracemalloc, it does not slow the stage down, but it needs ``/proc``.
+    """
+
+    def __init__(self, interval=0.005):
+        super(_PeakSampler, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.start_rss = self.peak_rss = self._rss()
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _rss():
+        with open(_STATM) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self._rss())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak_rss = max(self.peak_rss, self._rss())
+        return self.peak_rss - self.start_rss
+
+
+def measure(func, *args):
+    gc.collect()
+    if os.path.exists(_STATM):
+        sampler = _PeakSampler()
+        sampler.start()
+        start = time.time()
+        try:
+            func(*args)
+        finally:
+            seconds = time.time() - start
+            peak = sampler.stop()
+    elif tracemalloc is not None:
+        tracemalloc.start()
+        start = time.time()
+        try:
+            func(*args)
+            seconds = time.time() - start
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    else:
+        # the peak of the whole process only grows, so its growth during the
+        # stage is a lower bound of the peak of the stage
+        start_rss = _max_rss()
+        start = time.time()
+        func(*args)
+        seconds = time.time() - start
+        peak = None if start_rss is None else _max_rss() - start_rss
+    return {'seconds': seconds,
+            'peak_mb': None if peak is None else peak / 2 ** 20}
+
+
+def _max_rss():
+    """the peak resident memory of the process in bytes, if it is known"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def run(sizes=reports.SIZES, stages=None, report=print):
+    """
+    Run the stages on each size. Only the ``stages`` given are measured, but
+    the stages before them are also run, as each stage works on the state
+    left by the previous ones.
+    """
+    names = [name for name, _, _ in reports.STAGES]
+    if stages is not None:
+        unknown = set(stages) - set(names)
+        if unknown:
+            raise ValueError('unknown stages: {}'.format(
+                ', '.join(sorted(unknown))))
+        last = max(names.index(name) for name in stages) if stages else -1
+    else:
+        last = len(names) - 1
+
+    results = {}
+    directory = tempfile.mkdtemp()
+    try:
+        for rows in sizes:
+            state = {'rows': rows, 'directory': directory}
+            reports.prepare(state)
+            results[str(rows)] = size_results = {}
+            for name, func, max_rows in reports.STAGES[:last + 1]:
+                if max_rows is not None and rows > max_rows:
+                    continue
+                if stages is not None and name not in stages:
+                    func(state)
+                    continue
+                size_results[name] = result = measure(func, state)
+                report('{:>8} {:<20} {:8.3f}s {:>11}'.format(
+                    rows, name, result['seconds'],
+                    '-' if result['peak_mb'] is None
+                    else '{:.1f}MB'.format(result['peak_mb'])))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def compare(results, baseline, threshold=1.2, report=print):
+    """
+    Print the ratios of ``results`` to ``baseline``, and return the
+    ``(rows, stage, measure)`` which are more than ``threshold`` times those
+    of the baseline, by more than the noise.
+    """
+    regressions = []
+    report('{:>8} {:<20} {:>8} {:>8}'.format('rows', 'stage', 'time',
+                                             'memory'))
+    for rows, size_results in sorted(results.items(), key=lambda i: int(i[0])):
+        for name, result in sorted(size_results.items()):
+            base = baseline.get(rows, {}).get(name)
+            if base is None:
+                continue
+            ratios = []
+            for key in ('seconds', 'peak_mb'):
+                if result[key] is None or base[key] is None:
+                    ratios.append(float('nan'))
+                    continue
+                ratio = result[key] / base[key] if base[key] > 0 else 1.0
+                if ratio > threshold and \
+                        result[key] - base[key] > _NOISE[key]:
+                    regressions.append((rows, name, key))
+                ratios.append(ratio)
+            report('{:>8} {:<20} {:7.2f}x {:7.2f}x'.format(rows, name,
+                                                           *ratios))
+    return regressions
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
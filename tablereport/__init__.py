@@ -1,3 +1,5 @@
+from .aggregate import register_aggregate
+from .instrument import Profile, add_hook, remove_hook
 from .selector import *
 from .style import Style
 from .tablereport import *
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from __future__ import division, unicode_literals
+
+
+def _mean(values):
+    if not len(values):
+        return None
+    return sum(values) / len(values)
+
+
+def _min(values):
+    return min(values) if len(values) else None
+
+
+def _max(values):
+    return max(values) if len(values) else None
+
+
+AGGREGATES = {
+    'sum': sum,
+    'mean': _mean,
+    'count': len,
+    'min': _min,
+    'max': _max,
+}
+
+
+def register_aggregate(name, func):
+    """register ``func`` so that it can be used by ``summary(aggregate=name)``
+
+    ``func`` receives a sequence of the values to summarize, which is an
+    ``array.array`` when they come from a numeric column of a columnar table,
+    and returns the value of the summary cell.
+    """
+    AGGREGATES[name] = func
+
+
+def get_aggregate(aggregate):
+    """get an aggregate function by name, or return it if it is callable"""
+    if callable(aggregate):
+        return aggregate
+    try:
+        return AGGREGATES[aggregate]
+    except KeyError:
+        raise ValueError('unknown aggregate: {}'.format(aggregate))
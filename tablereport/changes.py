@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tracking of the changes made to a table since it was last written, see
+``Table.track_changes``.
+"""
+from __future__ import unicode_literals
+
+from .rows import RowStore
+from .tablereport import Cell
+
+
+class Changes(object):
+    """
+    The rows of a table changed since the last ``clear``.
+
+    Rows are marked by the operations of the table, and by its rows and cells
+    (see ``TrackedRow``) when they are set. The rows marked by their objects
+    are numbered when the changes are read, as rows move when rows are
+    inserted above them.
+    """
+
+    def __init__(self):
+        # the numbers of the changed rows
+        self.rows = set()
+        # the first row moved by an inserted row or column, all the rows from
+        # it being changed
+        self.rows_from = None
+        # id -> TrackedRow, for the rows which marked themselves
+        self.tracked_rows = {}
+
+    def __bool__(self):
+        return bool(self.rows) or self.rows_from is not None \
+            or bool(self.tracked_rows)
+
+    __nonzero__ = __bool__
+
+    def insert(self, row_num):
+        """mark the rows moved by a row inserted at ``row_num``"""
+        if self.rows_from is None or row_num < self.rows_from:
+            self.rows_from = row_num
+
+    def mark(self, row):
+        """mark the ``TrackedRow`` ``row``, wherever it is in the table"""
+        self.tracked_rows[id(row)] = row
+
+    def dirty_rows(self, table):
+        """the sorted numbers of the changed rows of ``table``"""
+        rows = set(self.rows)
+        if self.rows_from is not None:
+            rows.update(range(self.rows_from, table.height))
+        if self.tracked_rows:
+            rows.update(self._row_nums(table))
+        return sorted(row_num for row_num in rows if row_num < table.height)
+
+    def _row_nums(self, table):
+        """the current numbers of the rows which marked themselves"""
+        data = table.data
+        row_nums, moved = [], False
+        for row in self.tracked_rows.values():
+            if row.row_num < table.height and data[row.row_num] is row:
+                row_nums.append(row.row_num)
+            else:
+                moved = True
+        if moved:
+            # the rows moved since their numbers were last updated, so all
+            # of them are numbered again, in one pass
+            row_nums = []
+            for row_num, row in enumerate(data):
+                if type(row) is TrackedRow:
+                    row.row_num = row_num
+                    if id(row) in self.tracked_rows:
+                        row_nums.append(row_num)
+        return row_nums
+
+    def clear(self, table=None, row_nums=None):
+        """
+        Forget the changes, once the table has been written. The rows of
+        ``table`` numbered ``row_nums``, all of them by default, are tracked
+        from then on.
+        """
+        self.rows.clear()
+        self.rows_from = None
+        self.tracked_rows.clear()
+        if table is None or not isinstance(table.data, RowStore):
+            return
+        data = table.data
+        if row_nums is None:
+            row_nums = range(table.height)
+        for row_num in row_nums:
+            row = data[row_num]
+            if type(row) is TrackedRow and row.changes is self:
+                # the cells set since the row was tracked are tracked too
+                row.row_num = row_num
+                list.__setitem__(row, slice(None),
+                                 [_track(cell, row) for cell in row])
+            else:
+                data[row_num] = TrackedRow(row, self, row_num)
+
+
+class TrackedRow(list):
+    """
+    A row of a tracked table, which marks itself as changed when its cells,
+    or their attributes (see ``TrackedCell``), are set.
+    """
+    __slots__ = ('changes', 'row_num')
+
+    def __init__(self, row, changes, row_num):
+        super(TrackedRow, self).__init__(
+            _track(cell, self) for cell in row)
+        self.changes = changes
+        # the number of the row when it was last numbered
+        self.row_num = row_num
+
+    def __setitem__(self, col, value):
+        self.changes.mark(self)
+        super(TrackedRow, self).__setitem__(col, value)
+
+    def __reduce__(self):
+        # pickled as a plain row
+        return list, (list(self),)
+
+
+def _track(cell, row):
+    """``cell`` as a cell of the ``TrackedRow`` ``row``"""
+    if type(cell) is Cell:
+        return TrackedCell(cell, row)
+    if type(cell) is TrackedCell:
+        object.__setattr__(cell, 'row', row)
+    return cell
+
+
+class TrackedCell(Cell):
+    """
+    A cell of a ``TrackedRow``, which marks its row as changed when its
+    attributes are set.
+    """
+    __slots__ = ('row',)
+
+    def __init__(self, cell, row):
+        set_slot = object.__setattr__
+        set_slot(self, 'value', cell.value)
+        set_slot(self, 'style', cell.style)
+        set_slot(self, '_span', cell._span)
+        set_slot(self, 'row', row)
+
+    def __setattr__(self, name, value):
+        Cell.__setattr__(self, name, value)
+        self.row.changes.mark(self.row)
+
+    def __reduce__(self):
+        # pickled as a plain cell
+        return Cell, (self.value, self.style, self.width, self.height)
@@ -0,0 +1,374 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import bisect
+from array import array
+
+from .tablereport import Cell, _SpanResolver
+
+_TYPECODES = {int: 'l', float: 'd'}
+
+# stored in place of a cell whose value is None, since None itself is used
+# for the merged placeholders
+_NULL = object()
+
+
+class _Column(object):
+    """
+    Values of a column.
+
+    If most of the values in a column have the same numeric type, they are kept
+    in a typed array and the remaining ones (header text, summary labels,
+    placeholders...) are kept in a sparse dict. Otherwise the column is a plain
+    list.
+    """
+    __slots__ = ('values', 'others', 'type')
+
+    def __init__(self, values):
+        counts = {}
+        for value in values:
+            counts[type(value)] = counts.get(type(value), 0) + 1
+        value_type = max(counts, key=counts.get) if counts else None
+
+        self.others = {}
+        if value_type in _TYPECODES and counts[value_type] * 2 > len(values):
+            self.type = value_type
+            self.values = array(_TYPECODES[value_type])
+            for row_num, value in enumerate(values):
+                self.values.append(0)
+                self.set(row_num, value)
+        else:
+            self.type = None
+            self.values = list(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, row_num):
+        if self.type is None:
+            return self.values[row_num]
+        if row_num in self.others:
+            return self.others[row_num]
+        return self.values[row_num]
+
+    def set(self, row_num, value):
+        if self.type is None:
+            self.values[row_num] = value
+            return
+
+        if type(value) is self.type:
+            try:
+                self.values[row_num] = value
+            except OverflowError:
+                pass
+            else:
+                self.others.pop(row_num, None)
+                return
+        self.values[row_num] = 0
+        self.others[row_num] = value
+
+    def insert_many(self, row_nums):
+        """insert a placeholder before each of the (sorted) ``row_nums``"""
+        values = self.values[:0]
+        start = 0
+        for row_num in row_nums:
+            values.extend(self.values[start:row_num])
+            values.append(None if self.type is None else 0)
+            start = row_num
+        values.extend(self.values[start:])
+        self.values = values
+
+        if self.type is not None:
+            others = dict((num + bisect.bisect_right(row_nums, num), other)
+                          for num, other in self.others.items())
+            for index, row_num in enumerate(row_nums):
+                others[row_num + index] = None
+            self.others = others
+
+    def reorder(self, start, order, moved):
+        """
+        Move the value ``start + order[i]`` to ``start + i``, ``moved``
+        mapping the old row numbers to the new ones.
+        """
+        values = self.values[start:start + len(order)]
+        reordered = values[:0]
+        reordered.extend(map(values.__getitem__, order))
+        self.values[start:start + len(order)] = reordered
+        if self.others:
+            self.others = dict((moved.get(num, num), other)
+                               for num, other in self.others.items())
+
+    def get_runs(self, runs):
+        """
+        Values of the ``(start, stop)`` row ranges, as a typed array when none
+        of them is out of the array.
+        """
+        if self.type is not None:
+            others = sorted(self.others)
+            if not any(bisect.bisect_left(others, start) !=
+                       bisect.bisect_left(others, stop) for start, stop in runs):
+                values = self.values[:0]
+                for start, stop in runs:
+                    values.extend(self.values[start:stop])
+                return values
+
+        values = []
+        for start, stop in runs:
+            if self.type is None:
+                values.extend(self.values[start:stop])
+            else:
+                values.extend(self.get(num) for num in range(start, stop))
+        return [None if value is _NULL else value for value in values]
+
+
+class ColumnarStorage(object):
+    """
+    Column oriented storage of table data.
+
+    Each column is stored in a ``_Column``, while the spans and the styles
+    which differ from the table style are kept in sparse dicts keyed by
+    position. ``Cell`` objects are only created when they are accessed, and
+    they read and write through to the storage.
+    """
+
+    def __init__(self, rows, width, style):
+        self.width = width
+        self.style = style
+        self._height = len(rows)
+        self._spans = {}
+        self._styles = {}
+        # the ``Changes`` of the table, if they are tracked
+        self.changes = None
+
+        columns = [[] for _ in range(width)]
+        for row_num, row in enumerate(rows):
+            for col_num in range(width):
+                value = row[col_num]
+                if isinstance(value, tuple):
+                    value, cell_style = value
+                    if value is None:
+                        value = _NULL
+                    if cell_style is not style:
+                        self._styles[row_num, col_num] = cell_style
+                columns[col_num].append(value)
+        self._columns = [_Column(values) for values in columns]
+
+        resolver = _SpanResolver(width)
+        for row_num in range(self._height):
+            resolver.feed(self[row_num])
+
+    def __len__(self):
+        return self._height
+
+    def __getitem__(self, row_num):
+        if isinstance(row_num, slice):
+            return [_ColumnarRow(self, num)
+                    for num in range(*row_num.indices(self._height))]
+        if row_num < 0:
+            row_num += self._height
+        if not 0 <= row_num < self._height:
+            raise IndexError('row index out of range')
+        return _ColumnarRow(self, row_num)
+
+    def __setitem__(self, row_num, row):
+        if isinstance(row_num, slice):
+            row_nums = range(*row_num.indices(self._height))
+            # the rows may be views of the rows they replace
+            rows = [list(cells) for cells in row]
+            if len(rows) != len(row_nums):
+                raise ValueError('only as many rows can be set')
+            for num, row in zip(row_nums, rows):
+                self[num] = row
+            return
+        for col_num in range(self.width):
+            self.set_cell(row_num, col_num, row[col_num])
+
+    def __iter__(self):
+        for row_num in range(self._height):
+            yield _ColumnarRow(self, row_num)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def get_cell(self, row_num, col_num):
+        if self._columns[col_num].get(row_num) is None:
+            return None
+        return ColumnarCell(self, row_num, col_num)
+
+    def set_cell(self, row_num, col_num, cell):
+        if self.changes is not None:
+            self.changes.rows.add(row_num)
+        position = row_num, col_num
+        if isinstance(cell, Cell):
+            value, style = cell.value, cell.style
+            span = cell.width, cell.height
+        else:
+            value, style, span = cell, self.style, (1, 1)
+
+        if cell is None:
+            self._columns[col_num].set(row_num, None)
+        else:
+            self._columns[col_num].set(row_num,
+                                       _NULL if value is None else value)
+
+        self._spans.pop(position, None)
+        self._styles.pop(position, None)
+        if cell is not None:
+            if span != (1, 1):
+                self._spans[position] = span
+            if style is not self.style:
+                self._styles[position] = style
+
+    def column_values(self, col_num, runs):
+        """values of a column in the ``(start, stop)`` row ranges"""
+        return self._columns[col_num].get_runs(runs)
+
+    def insert(self, row_num, row):
+        self.insert_rows([row_num], [row])
+
+    def insert_rows(self, row_nums, rows):
+        """
+        Insert ``rows`` in one pass, so that they end up at the (sorted)
+        ``row_nums``.
+        """
+        positions = [row_num - index for index, row_num in enumerate(row_nums)]
+        for column in self._columns:
+            column.insert_many(positions)
+        self._spans = _shift(self._spans, 0, positions)
+        self._styles = _shift(self._styles, 0, positions)
+        self._height += len(rows)
+        for row_num, row in zip(row_nums, rows):
+            self[row_num] = row
+
+    def reorder_rows(self, start, order):
+        """move the row ``start + order[i]`` to ``start + i``, for each i"""
+        moved = dict((start + old, start + new)
+                     for new, old in enumerate(order) if old != new)
+        for column in self._columns:
+            column.reorder(start, order, moved)
+        self._spans = dict(((moved.get(row_num, row_num), col_num), span)
+                           for (row_num, col_num), span in self._spans.items())
+        self._styles = dict(((moved.get(row_num, row_num), col_num), style)
+                            for (row_num, col_num), style
+                            in self._styles.items())
+
+    def insert_column(self, col_num):
+        self._columns.insert(col_num, _Column([None] * self._height))
+        self._spans = _shift(self._spans, 1, [col_num])
+        self._styles = _shift(self._styles, 1, [col_num])
+        self.width += 1
+
+
+def _shift(positions, axis, starts):
+    """shift the keys of ``positions`` by the (sorted) ``starts`` before them"""
+    shifted = {}
+    for position, value in positions.items():
+        offset = bisect.bisect_right(starts, position[axis])
+        if offset:
+            position = list(position)
+            position[axis] += offset
+            position = tuple(position)
+        shifted[position] = value
+    return shifted
+
+
+class _ColumnarRow(object):
+    __slots__ = ('storage', 'row_num')
+
+    def __init__(self, storage, row_num):
+        self.storage = storage
+        self.row_num = row_num
+
+    def __getitem__(self, col_num):
+        if col_num < 0:
+            col_num += self.storage.width
+        if not 0 <= col_num < self.storage.width:
+            raise IndexError('column index out of range')
+        return self.storage.get_cell(self.row_num, col_num)
+
+    def __setitem__(self, col_num, value):
+        self.storage.set_cell(self.row_num, col_num, value)
+
+    def __iter__(self):
+        for col_num in range(self.storage.width):
+            yield self.storage.get_cell(self.row_num, col_num)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __len__(self):
+        return self.storage.width
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class ColumnarCell(Cell):
+    """a cell created on demand, reading and writing a ``ColumnarStorage``"""
+    __slots__ = ('_storage', '_position')
+
+    def __init__(self, storage, row_num, col_num):
+        self._storage = storage
+        self._position = row_num, col_num
+
+    def _changed(self):
+        if self._storage.changes is not None:
+            self._storage.changes.rows.add(self._position[0])
+
+    @property
+    def value(self):
+        row_num, col_num = self._position
+        value = self._storage._columns[col_num].get(row_num)
+        return None if value is _NULL else value
+
+    @value.setter
+    def value(self, value):
+        row_num, col_num = self._position
+        self._changed()
+        self._storage._columns[col_num].set(row_num,
+                                            _NULL if value is None else value)
+
+    @property
+    def style(self):
+        return self._storage._styles.get(self._position, self._storage.style)
+
+    @style.setter
+    def style(self, style):
+        self._changed()
+        if style is self._storage.style:
+            self._storage._styles.pop(self._position, None)
+        else:
+            self._storage._styles[self._position] = style
+
+    @property
+    def width(self):
+        return self._storage._spans.get(self._position, (1, 1))[0]
+
+    @width.setter
+    def width(self, width):
+        self._set_span(width, self.height)
+
+    @property
+    def height(self):
+        return self._storage._spans.get(self._position, (1, 1))[1]
+
+    @height.setter
+    def height(self, height):
+        self._set_span(self.width, height)
+
+    def _set_span(self, width, height):
+        self._changed()
+        if (width, height) == (1, 1):
+            self._storage._spans.pop(self._position, None)
+        else:
+            self._storage._spans[self._position] = width, height
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of the public operations.
+
+Nothing is recorded unless a hook is registered, either directly with
+``add_hook`` or by a ``Profile``::
+
+    with Profile() as profile:
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas.group().merge().left.summary(label_span=1, label='total')
+        write_to_excel('report.xlsx', table)
+    logger.info(profile.to_json())
+
+Nested operations are recorded too, so the record of ``Areas.summary``
+includes the ones of the ``Area.summary`` it calls.
+"""
+from __future__ import unicode_literals
+
+import functools
+import json
+import time
+
+# hook(name, record) called after each operation
+_hooks = []
+
+# number of areas created and of rows inserted since the module was loaded
+_counts = {'areas': 0, 'rows': 0}
+
+
+def add_hook(hook):
+    """
+    Call ``hook(name, record)`` after each public operation, where ``name`` is
+    like ``'Area.group'`` and ``record`` is a dict of:
+
+    * ``seconds``: the time spent in the operation
+    * ``cells``: the number of cells of the object it operated on
+    * ``areas``: the number of areas it created
+    * ``rows``: the number of rows it inserted into the table
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def _cells(obj):
+    if isinstance(obj, list):
+        return sum(_cells(item) for item in obj)
+    # a lazy table has no height, only the rows iterated while instrumented
+    height = getattr(obj, '_rows_iterated', None)
+    if height is None:
+        height = getattr(obj, 'height', 1)
+    return getattr(obj, 'width', 1) * height
+
+
+def instrumented(name, target=0):
+    """
+    Record the calls of a function as the operation ``name``. The cells are
+    counted on its ``target``-th argument.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _hooks:
+                return func(*args, **kwargs)
+
+            areas, rows = _counts['areas'], _counts['rows']
+            start = time.time()
+            result = func(*args, **kwargs)
+            record = {
+                'seconds': time.time() - start,
+                'cells': _cells(args[target]),
+                'areas': _counts['areas'] - areas,
+                'rows': _counts['rows'] - rows,
+            }
+            for hook in list(_hooks):
+                hook(name, record)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class Profile(object):
+    """
+    Sum up the records of the operations per name, while it is used as a
+    context manager.
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def __enter__(self):
+        add_hook(self.record)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        remove_hook(self.record)
+
+    def record(self, name, record):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = dict.fromkeys(
+                ('calls', 'seconds', 'cells', 'areas', 'rows'), 0)
+        stats['calls'] += 1
+        for key, value in record.items():
+            stats[key] += value
+
+    def as_dict(self):
+        return dict((name, dict(stats)) for name, stats in self.stats.items())
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), sort_keys=True, **kwargs)
@@ -0,0 +1,335 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import itertools
+import random
+import weakref
+
+
+class _Node(object):
+    """
+    A row range ``[start, end)`` in a treap ordered by start.
+
+    ``start``, ``end`` and ``max_end`` are relative to the ``lazy`` offsets of
+    the ancestors which have not been pushed down yet.
+    """
+    __slots__ = ('ref', 'y', 'width', 'seq', 'priority', 'start', 'end',
+                 'max_end', 'lazy', 'left', 'right', 'parent')
+
+    def __init__(self, ref, y, width, seq):
+        self.ref = ref
+        self.y = y
+        self.width = width
+        self.seq = seq
+        self.priority = random.random()
+        self.lazy = 0
+        self.left = self.right = self.parent = None
+
+    def reset(self, start, end):
+        self.start = start
+        self.end = self.max_end = end
+        self.lazy = 0
+        self.left = self.right = self.parent = None
+
+
+def _push(node):
+    if node.lazy:
+        for child in (node.left, node.right):
+            if child is not None:
+                child.start += node.lazy
+                child.end += node.lazy
+                child.max_end += node.lazy
+                child.lazy += node.lazy
+        node.lazy = 0
+
+
+def _update(node):
+    max_end = node.end
+    left, right = node.left, node.right
+    if left is not None:
+        left.parent = node
+        if left.max_end + node.lazy > max_end:
+            max_end = left.max_end + node.lazy
+    if right is not None:
+        right.parent = node
+        if right.max_end + node.lazy > max_end:
+            max_end = right.max_end + node.lazy
+    node.max_end = max_end
+
+
+def _split(node, start):
+    """split into the nodes which start before ``start`` and the others"""
+    if node is None:
+        return None, None
+    _push(node)
+    if node.start < start:
+        node.right, right = _split(node.right, start)
+        _update(node)
+        return node, right
+    else:
+        left, node.left = _split(node.left, start)
+        _update(node)
+        return left, node
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        _push(left)
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    else:
+        _push(right)
+        right.left = _merge(left, right.left)
+        _update(right)
+        return right
+
+
+class AreaIndex(object):
+    """
+    Row ranges of the areas of a table.
+
+    Areas are only referenced weakly, and are dropped from the index once they
+    are garbage collected. Inserting a row shifts all the ranges below it at
+    once and finds the ranges containing it, both in logarithmic time.
+
+    Besides areas, the index also keeps the ranges of merged cells, so that
+    they keep growing with the rows inserted into them after the areas which
+    merged them are gone. The ranges of the cells which were overwritten or
+    unmerged since then are dropped by the next row inserted into them.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._nodes = {}
+        self._dead = []
+        self._seq = itertools.count()
+
+    def __iter__(self):
+        """live areas, ordered by position"""
+        stack, node = [], self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            area = node.ref() if node.ref is not None else None
+            if area is not None:
+                yield area
+            node = node.right
+
+    def add(self, area, start, height):
+        node = _Node(weakref.ref(area, self._on_collected), None, None,
+                     next(self._seq))
+        self._nodes[id(node.ref)] = node
+        self._insert(node, start, start + height)
+        return node
+
+    def add_span(self, start, height, y, width):
+        """keep the row range of a merged cell"""
+        node = _Node(None, y, width, next(self._seq))
+        self._insert(node, start, start + height)
+        return node
+
+    def add_spans(self, spans):
+        """
+        Keep the row ranges of many merged cells, as ``(start, height, y,
+        width)``, rebuilding the index at once rather than inserting them one
+        by one.
+        """
+        self._purge()
+        nodes = []
+        stack, node = [], self._root
+        while stack or node is not None:
+            while node is not None:
+                _push(node)
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            nodes.append(node)
+            node = node.right
+        for start, height, y, width in spans:
+            node = _Node(None, y, width, next(self._seq))
+            node.reset(start, start + height)
+            nodes.append(node)
+        nodes.sort(key=lambda node: node.start)
+
+        # the priorities are handed out in preorder, so that each node has a
+        # higher priority than the nodes below it
+        priorities = iter(sorted((random.random() for _ in nodes),
+                                 reverse=True))
+
+        def build(low, high):
+            if low >= high:
+                return None
+            middle = (low + high) // 2
+            node = nodes[middle]
+            node.priority = next(priorities)
+            node.left = build(low, middle)
+            node.right = build(middle + 1, high)
+            _update(node)
+            return node
+
+        self._root = build(0, len(nodes))
+        if self._root is not None:
+            self._root.parent = None
+
+    def spans(self):
+        """the ``(start, height, y, width)`` of the merged cells, by position"""
+        stack = [(self._root, 0)]
+        spans = []
+        while stack:
+            node, offset = stack.pop()
+            if node is None:
+                continue
+            if node.ref is None:
+                spans.append((node.start + offset, node.end - node.start,
+                              node.y, node.width))
+            stack.append((node.left, offset + node.lazy))
+            stack.append((node.right, offset + node.lazy))
+        spans.sort()
+        return spans
+
+    def spans_between(self, start, stop):
+        """
+        The ``(start, height, y, width)`` of the merged cells overlapping the
+        rows from ``start`` to ``stop``.
+        """
+        stack = [(self._root, 0)]
+        spans = []
+        while stack:
+            node, offset = stack.pop()
+            if node is None or node.max_end + offset <= start:
+                continue
+            node_start = node.start + offset
+            if node.ref is None and node_start < stop \
+                    and node.end + offset > start:
+                spans.append((node_start, node.end - node.start, node.y,
+                              node.width))
+            stack.append((node.left, offset + node.lazy))
+            if node_start < stop:
+                stack.append((node.right, offset + node.lazy))
+        return spans
+
+    def start(self, node):
+        start = node.start
+        parent = node.parent
+        while parent is not None:
+            start += parent.lazy
+            parent = parent.parent
+        return start
+
+    def height(self, node):
+        return node.end - node.start
+
+    def set_height(self, node, height):
+        node.end = node.start + height
+        while node is not None:
+            _update(node)
+            node = node.parent
+
+    def move(self, node, start):
+        height = node.end - node.start
+        self._remove(node)
+        self._insert(node, start, start + height)
+
+    def insert_row(self, row_num, is_merged=None):
+        """
+        Insert a row at ``row_num``.
+
+        The ranges starting at or after it are moved down, and the ranges
+        containing it or ending right above it grow by one row. Return the
+        ``(x, y, width, height)`` of the latter before they grow, in the order
+        in which they were added.
+
+        The ranges of merged cells for which ``is_merged(x, y, width,
+        height)`` is false are no longer the ones of merged cells, and are
+        removed instead.
+        """
+        self._purge()
+        left, right = _split(self._root, row_num)
+        if right is not None:
+            right.start += 1
+            right.end += 1
+            right.max_end += 1
+            right.lazy += 1
+
+        grown = []
+        stale = []
+        self._grow(left, 0, row_num, grown, is_merged, stale)
+        self._root = _merge(left, right)
+        if self._root is not None:
+            self._root.parent = None
+        for node in stale:
+            self._remove(node)
+
+        grown.sort(key=lambda item: item[0])
+        return [item[1:] for item in grown]
+
+    def _grow(self, node, offset, row_num, grown, is_merged, stale):
+        if node is None or node.max_end + offset < row_num:
+            return
+        if node.end + offset >= row_num:
+            if node.ref is None:
+                y, width = node.y, node.width
+                if is_merged is not None and not is_merged(
+                        node.start + offset, y, width, node.end - node.start):
+                    stale.append(node)
+                    y = None
+            else:
+                area = node.ref()
+                y, width = (area._y, area.width) if area else (None, None)
+            if y is not None:
+                grown.append((node.seq, node.start + offset, y, width,
+                              node.end - node.start))
+            node.end += 1
+        self._grow(node.left, offset + node.lazy, row_num, grown, is_merged,
+                   stale)
+        self._grow(node.right, offset + node.lazy, row_num, grown, is_merged,
+                   stale)
+        _update(node)
+
+    def _insert(self, node, start, end):
+        self._purge()
+        node.reset(start, end)
+        left, right = _split(self._root, start)
+        self._root = _merge(_merge(left, node), right)
+        self._root.parent = None
+
+    def _remove(self, node):
+        path = []
+        parent = node
+        while parent is not None:
+            path.append(parent)
+            parent = parent.parent
+        for ancestor in reversed(path):
+            _push(ancestor)
+
+        parent = node.parent
+        child = _merge(node.left, node.right)
+        if child is not None:
+            child.parent = parent
+        if parent is None:
+            self._root = child
+        else:
+            if parent.left is node:
+                parent.left = child
+            else:
+                parent.right = child
+            while parent is not None:
+                _update(parent)
+                parent = parent.parent
+
+    def _on_collected(self, ref):
+        # called by the garbage collector, possibly in the middle of another
+        # operation, so the node is only removed by the next operation
+        self._dead.append(id(ref))
+
+    def _purge(self):
+        while self._dead:
+            self._remove(self._nodes.pop(self._dead.pop()))
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Building grouped and subtotalled tables in one pass, see ``Table.group_by``.
+"""
+from __future__ import unicode_literals
+
+import collections
+import itertools
+import operator
+
+from .aggregate import get_aggregate
+
+
+def group_by(body, keys, header, style, label, label_span, subtotal_levels,
+             total, label_style, value_style, total_label_style,
+             total_value_style, aggregate, sort):
+    from .tablereport import _paused_gc
+
+    with _paused_gc():
+        return _group_by(body, keys, header, style, label, label_span,
+                         subtotal_levels, total, label_style, value_style,
+                         total_label_style, total_value_style, aggregate,
+                         sort)
+
+
+def _group_by(body, keys, header, style, label, label_span, subtotal_levels,
+              total, label_style, value_style, total_label_style,
+              total_value_style, aggregate, sort):
+    from .rows import RowStore
+    from .tablereport import Cell, Table
+
+    if label_span is None:
+        label_span = keys + 1
+    if subtotal_levels is None:
+        subtotal_levels = range(keys)
+    subtotal_levels = set(subtotal_levels)
+
+    body = list(body)
+    if any(value is None for row in body for value in row[:keys]):
+        raise ValueError('the keys of the rows must not be None')
+    styled = any(isinstance(value, tuple) for row in body
+                 for value in row[:keys])
+    ordered = _ordered(body, keys, sort, styled)
+    columns = [_values(column) for column in zip(*ordered)]
+    # the rows are wrapped as ``Table`` wraps its body, once they are in
+    # their final order, so that ``None`` merges the same cells
+    table = Table(header=header, body=[list(row) for row in ordered],
+                  style=style, columnar=False, copy=False)
+    style = table.style
+    header, rows = table[:table.header.height], table[table.header.height:]
+    width = table.width
+    if not 0 < keys <= label_span <= width:
+        raise ValueError('the keys and the label must fit in the table')
+
+    columns = columns or [[]] * width
+    # the cells merged into others are not summarized again
+    merged_cols = set(col_num for col_num, column in enumerate(columns)
+                      if any(value is None for value in column))
+    aggregates = aggregate if isinstance(aggregate, (list, tuple)) \
+        else [aggregate] * (width - label_span)
+    aggregates = [get_aggregate(func) for func in aggregates]
+
+    def summary_row(label_col, span, start, stop, label_style, value_style):
+        row = [None] * width
+        if span:
+            row[label_col] = Cell(label, width=span,
+                                  style=style if label_style is None
+                                  else label_style)
+        value_style = style if value_style is None else value_style
+        for col_num, func in enumerate(aggregates, label_span):
+            values = columns[col_num][start:stop]
+            if col_num in merged_cols:
+                values = [value for value in values if value is not None]
+            row[col_num] = Cell(func(values), style=value_style)
+        return row
+
+    first_row = len(header)
+    data = []
+    total_row_nums = []
+    # [start, height, column] of the merged cells of the keys, whose heights
+    # also grow with the summary rows added right below them, as the row
+    # ranges of the merged cells kept by the table would
+    spans = []
+
+    def add_rows(level, start, stop):
+        """
+        Add the rows ``start:stop`` grouped by the keys from ``level``, and
+        return the spans ending with them.
+        """
+        if level == keys:
+            data.extend(rows[start:stop])
+            return []
+
+        tail = []
+        group_start = start
+        for _, group in itertools.groupby(columns[level][start:stop]):
+            group_stop = group_start + sum(1 for _ in group)
+            first = len(data)
+            tail = add_rows(level + 1, group_start, group_stop)
+            if level in subtotal_levels:
+                data.append(summary_row(level + 1, label_span - level - 1,
+                                        group_start, group_stop,
+                                        label_style, value_style))
+                total_row_nums.append(first_row + len(data) - 1)
+                for span in tail:
+                    span[1] += 1
+
+            height = len(data) - first
+            data[first][level].height = height
+            for row_num in range(first + 1, len(data)):
+                data[row_num][level] = None
+            span = [first_row + first, height, level]
+            spans.append(span)
+            tail = tail + [span]
+            group_start = group_stop
+        return tail
+
+    tail = add_rows(0, 0, len(rows))
+    if total:
+        data.append(summary_row(
+            0, label_span, 0, len(rows),
+            label_style if total_label_style is None else total_label_style,
+            value_style if total_value_style is None else total_value_style))
+        total_row_nums.append(first_row + len(data) - 1)
+        for span in tail:
+            span[1] += 1
+
+    table._data = RowStore([header, data])
+    table.height = len(table._data)
+    table.body.height = len(data)
+    table._total_rows = total_row_nums
+    table.areas.add_spans((start, height, col_num, 1)
+                          for start, height, col_num in spans)
+    return table
+
+
+def _ordered(body, keys, sort, styled):
+    """
+    The rows of ``body`` with the rows of each group next to each other.
+    The keys are compared without their styles if they are ``styled``.
+    """
+    if sort == 'hash':
+        return _partition(body, 0, keys, styled)
+    if sort:
+        key = operator.itemgetter(*range(keys))
+        if styled:
+            return sorted(body, key=lambda row: _values(key(row))
+                          if keys > 1 else _value(key(row)))
+        return sorted(body, key=key)
+    return body
+
+
+def _value(value):
+    """the value of a ``(value, style)`` entry of a row"""
+    return value[0] if isinstance(value, tuple) else value
+
+
+def _values(values):
+    values = list(values)
+    if any(isinstance(value, tuple) for value in values):
+        return [_value(value) for value in values]
+    return values
+
+
+def _partition(rows, level, keys, styled):
+    # groups in the order of their first rows, without comparing the keys
+    if level == keys:
+        return rows
+    groups = collections.OrderedDict()
+    for row in rows:
+        groups.setdefault(_value(row[level]) if styled else row[level],
+                          []).append(row)
+    return [row for group in groups.values()
+            for row in _partition(group, level + 1, keys, styled)]
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import bisect
+import itertools
+
+# the number of rows of the blocks split by inserting or deleting rows
+_BLOCK_SIZE = 1024
+
+
+class RowStore(object):
+    """
+    Row oriented storage of table data.
+
+    The rows are kept in a rope of blocks: a list of row lists, with the row
+    number of the first row of each block. Looking a row up is a bisect over
+    the blocks, and inserting or deleting a row only moves the rows of its
+    block, instead of all the rows below it as ``list.insert`` would.
+
+    The lists given to the store become its first blocks without being
+    copied. A block larger than ``2 * _BLOCK_SIZE`` rows is only split into
+    smaller ones when rows are inserted into it or deleted from it, unless
+    the blocks are ``shared``: the lists then stay the storage of their rows
+    whatever their sizes, as a table built with ``copy=False`` keeps its body
+    in the list it was given, and rows are inserted into them in place.
+
+    Inserting or deleting a row in a shared block therefore moves all the
+    rows below it in the block, as ``list.insert`` does, and ``insert_rows``
+    rebuilds the whole block, so that the cost of each insert grows with the
+    size of the list rather than with the block size.
+    """
+    __slots__ = ('blocks', '_shared', '_starts', '_length', '_last')
+
+    def __init__(self, blocks=(), shared=False):
+        if shared:
+            self.blocks = list(blocks) or [[]]
+            self._shared = set(id(block) for block in self.blocks)
+        else:
+            self.blocks = [block for block in blocks if block] or [[]]
+            self._shared = set()
+        self._update()
+
+    def _update(self):
+        # the row number of the first row of each block
+        self._starts = []
+        self._length = 0
+        for block in self.blocks:
+            self._starts.append(self._length)
+            self._length += len(block)
+        self._forget()
+
+    def _forget(self):
+        # (start, stop, block) of the block of the last row looked up, as rows
+        # are mostly read one after another
+        self._last = 0, 0, None
+
+    def _locate(self, row_num):
+        """the number of the block holding ``row_num``"""
+        return bisect.bisect_right(self._starts, row_num) - 1
+
+    def _index(self, row_num):
+        if row_num < 0:
+            row_num += self._length
+        if not 0 <= row_num < self._length:
+            raise IndexError('row index out of range')
+        return row_num
+
+    def _split(self, num):
+        """split the block ``num`` if it is too large to be modified"""
+        block = self.blocks[num]
+        if len(block) <= 2 * _BLOCK_SIZE or id(block) in self._shared:
+            return
+        self.blocks[num:num + 1] = [block[start:start + _BLOCK_SIZE]
+                                    for start in range(0, len(block),
+                                                       _BLOCK_SIZE)]
+        self._update()
+
+    def _shift(self, num, offset):
+        """move the blocks after ``num`` by ``offset`` rows"""
+        starts = self._starts
+        if num + 1 < len(starts):
+            starts[num + 1:] = [start + offset for start in starts[num + 1:]]
+        self._length += offset
+        self._forget()
+
+    def _runs(self, start, stop):
+        """(block, block start, block stop) of the rows ``start:stop``"""
+        for num in range(self._locate(start), len(self.blocks)):
+            offset = self._starts[num]
+            if offset >= stop:
+                break
+            yield (self.blocks[num], max(start - offset, 0),
+                   min(stop - offset, len(self.blocks[num])))
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, row_num):
+        if type(row_num) is int:
+            start, stop, block = self._last
+            if start <= row_num < stop:
+                return block[row_num - start]
+            if 0 <= row_num < self._length:
+                num = bisect.bisect_right(self._starts, row_num) - 1
+                block = self.blocks[num]
+                start = self._starts[num]
+                self._last = start, start + len(block), block
+                return block[row_num - start]
+        if isinstance(row_num, slice):
+            start, stop, step = row_num.indices(self._length)
+            if step != 1:
+                return list(self)[row_num]
+            rows = []
+            for block, block_start, block_stop in self._runs(start, stop):
+                rows.extend(block[block_start:block_stop])
+            return rows
+
+        row_num = self._index(row_num)
+        num = self._locate(row_num)
+        return self.blocks[num][row_num - self._starts[num]]
+
+    def __setitem__(self, row_num, row):
+        if isinstance(row_num, slice):
+            start, stop, step = row_num.indices(self._length)
+            rows = list(row)
+            if step != 1 or len(rows) != max(stop - start, 0):
+                raise ValueError('only a range of rows can be replaced, '
+                                 'by as many rows')
+            index = 0
+            for block, block_start, block_stop in self._runs(start, stop):
+                size = block_stop - block_start
+                block[block_start:block_stop] = rows[index:index + size]
+                index += size
+            return
+
+        row_num = self._index(row_num)
+        num = self._locate(row_num)
+        self.blocks[num][row_num - self._starts[num]] = row
+
+    def __delitem__(self, row_num):
+        row_num = self._index(row_num)
+        num = self._locate(row_num)
+        self._split(num)
+        num = self._locate(row_num)
+        block = self.blocks[num]
+        del block[row_num - self._starts[num]]
+        if not block and len(self.blocks) > 1 \
+                and id(block) not in self._shared:
+            del self.blocks[num]
+            del self._starts[num]
+            num -= 1
+        self._shift(num, -1)
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.blocks)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def insert(self, row_num, row):
+        """
+        Insert ``row`` before ``row_num``. A row inserted between two blocks
+        starts the second one.
+        """
+        if row_num < 0:
+            row_num = max(row_num + self._length, 0)
+        row_num = min(row_num, self._length)
+        num = self._locate(row_num)
+        self._split(num)
+        num = self._locate(row_num)
+        self.blocks[num].insert(row_num - self._starts[num], row)
+        self._shift(num, 1)
+
+    def insert_rows(self, row_nums, rows):
+        """
+        Insert ``rows`` in one pass, so that they end up at the (sorted)
+        ``row_nums``.
+        """
+        positions = [row_num - index for index, row_num in enumerate(row_nums)]
+        blocks = []
+        index = 0
+        for num, block in enumerate(self.blocks):
+            if num + 1 < len(self.blocks):
+                stop = bisect.bisect_left(positions, self._starts[num + 1],
+                                          index)
+            else:
+                stop = len(positions)
+            if stop == index:
+                blocks.append(block)
+                continue
+
+            offset = self._starts[num]
+            merged = []
+            start = 0
+            for position, row in zip(positions[index:stop], rows[index:stop]):
+                merged.extend(block[start:position - offset])
+                merged.append(row)
+                start = position - offset
+            merged.extend(block[start:])
+            if id(block) in self._shared:
+                block[:] = merged
+                blocks.append(block)
+            else:
+                blocks.extend(merged[chunk:chunk + _BLOCK_SIZE]
+                              for chunk in range(0, len(merged), _BLOCK_SIZE))
+            index = stop
+        self.blocks = blocks
+        self._update()
+
+    def reorder_rows(self, start, order):
+        """move the row ``start + order[i]`` to ``start + i``, for each i"""
+        stop = start + len(order)
+        rows = self[start:stop]
+        self[start:stop] = [rows[index] for index in order]
+
+    def extend(self, rows):
+        """add ``rows`` at the bottom, as a new block which is not copied"""
+        if not rows:
+            return
+        if not self._length and not self._shared:
+            self.blocks = [rows]
+        else:
+            self.blocks.append(rows)
+        self._update()
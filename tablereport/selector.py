@@ -2,62 +2,218 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from .tablereport import Areas, Area, Cells
+import itertools
+import operator
 
+from .tablereport import Areas, Area, AreaSet, Cells
 
-class ColumnSelector(object):
-    def __init__(self, func, width=1):
+
+class Selector(object):
+    """
+    Base class of the selectors.
+
+    A selector computes a mask of the lines or cells of an area: a bool per
+    column for column selectors, per row for row selectors, and per cell,
+    column by column, for cell selectors. Selectors of the same kind can be
+    combined with ``&``, ``|`` and ``~``, which combine their masks::
+
+        selector = RowSelector(lambda row: row > 1) & ~RowSelector(is_total)
+
+    The default mask calls ``match`` on each column number, row number (both
+    starting from 1) or cell, the cells being visited row by row.
+    """
+    kind = None
+
+    def match(self, item):
+        """whether the column, the row or the cell ``item`` is selected"""
+        return self.func(item)
+
+    def mask(self, area):
+        if self.kind == 'column':
+            return [bool(self.match(col)) for col in range(1, area.width + 1)]
+        if self.kind == 'row':
+            return [bool(self.match(row))
+                    for row in range(1, area.height + 1)]
+
+        x, y = area.position
+        rows = [area.table[x + row_num] for row_num in range(area.height)]
+        matched = [[bool(self.match(row[y + col_num]))
+                    for col_num in range(area.width)] for row in rows]
+        if not matched:
+            return [[] for _ in range(area.width)]
+        return [list(column) for column in zip(*matched)]
+
+    def select(self, area, compact=False):
+        """
+        Select the areas of ``area`` matched by the mask, as ``Areas``, or as
+        an ``AreaSet`` with ``compact=True``.
+        """
+        return _SELECT[self.kind](self, area, self.mask(area), compact)
+
+    def __and__(self, other):
+        return _Combined(operator.and_, self, other)
+
+    def __or__(self, other):
+        return _Combined(operator.or_, self, other)
+
+    def __invert__(self):
+        return _Combined(operator.not_, self)
+
+
+class ColumnSelector(Selector):
+    kind = 'column'
+
+    def __init__(self, func, width=1, vectorized=False):
         """
-        :param func: eg: ``lambda col:col==1``
+        :param func: eg: ``lambda col:col==1``. With ``vectorized=True``,
+            it receives the sequence of column numbers and returns a
+            sequence of bools.
         """
         self.func = func
         self.width = width
+        self.vectorized = vectorized
+
+    def mask(self, area):
+        if self.vectorized:
+            return _vectorized_mask(self, range(1, area.width + 1))
+        return super(ColumnSelector, self).mask(area)
 
-    def select(self, area):
-        x, y = area.position
-        width = area.width
-
-        areas = Areas()
-        for col in range(width):
-            if self.func(col + 1):
-                area = Area(table=area.table, width=self.width,
-                            height=area.height,
-                            position=(x, y + col))
-                areas.append(area)
-        return areas
 
+class RowSelector(Selector):
+    kind = 'row'
 
-class RowSelector(object):
-    def __init__(self, func, height=1):
+    def __init__(self, func, height=1, vectorized=False):
         """
-        :param func: eg: ``lambda row:row==1``
+        :param func: eg: ``lambda row:row==1``. With ``vectorized=True``,
+            it receives the sequence of row numbers and returns a sequence
+            of bools.
         """
         self.func = func
         self.height = height
+        self.vectorized = vectorized
+
+    def mask(self, area):
+        if self.vectorized:
+            return _vectorized_mask(self, range(1, area.height + 1))
+        return super(RowSelector, self).mask(area)
 
-    def select(self, area):
+
+class CellSelector(Selector):
+    kind = 'cell'
+
+    def __init__(self, func, vectorized=False):
+        """
+        :param func: eg: ``lambda cell:cell.value < 60``. With
+            ``vectorized=True``, it receives the values of a whole column,
+            possibly as an ``array``, with ``None`` for the cells covered by
+            merged ones, and returns a sequence of bools, eg:
+            ``lambda values: [value < 60 for value in values]``.
+        """
+        self.func = func
+        self.vectorized = vectorized
+
+    def mask(self, area):
+        if not self.vectorized:
+            return super(CellSelector, self).mask(area)
         x, y = area.position
-        height = area.height
-
-        areas = Areas()
-        for row in range(height):
-            if self.func(row + 1):
-                area = Area(table=area.table, width=area.width,
-                            height=self.height,
-                            position=(x + row, y))
-                areas.append(area)
+        return [list(map(bool, self.func(
+            area.table._column_values(y + col_num, x, x + area.height))))
+            for col_num in range(area.width)]
+
+
+class _Combined(Selector):
+    def __init__(self, op, *selectors):
+        kinds = set(selector.kind for selector in selectors)
+        if len(kinds) != 1:
+            raise ValueError('cannot combine selectors of different kinds')
+        self.op = op
+        self.selectors = selectors
+        self.kind = selectors[0].kind
+        # the height or width of the selected lines
+        self.height = getattr(selectors[0], 'height', 1)
+        self.width = getattr(selectors[0], 'width', 1)
+
+    def match(self, item):
+        return self.op(*[bool(selector.match(item))
+                         for selector in self.selectors])
+
+    def mask(self, area):
+        masks = [selector.mask(area) for selector in self.selectors]
+        if self.kind == 'cell':
+            return [list(map(self.op, *columns)) for columns in zip(*masks)]
+        return list(map(self.op, *masks))
+
+
+def _vectorized_mask(selector, nums):
+    return list(map(bool, selector.func(nums)))
+
+
+def _matched(mask):
+    return itertools.compress(range(len(mask)), mask)
+
+
+def _mask_runs(mask):
+    """the ``(start, stop)`` ranges of the true values of a mask"""
+    # the indexes where the mask changes, found without a loop in Python
+    bounds = list(itertools.compress(range(1, len(mask)),
+                                     map(operator.ne, mask[1:], mask[:-1])))
+    if mask and mask[0]:
+        bounds.insert(0, 0)
+    if len(bounds) % 2:
+        bounds.append(len(mask))
+    return zip(bounds[::2], bounds[1::2])
+
+
+def _select_columns(selector, area, mask, compact):
+    x, y = area.position
+    if compact:
+        areas = AreaSet(area.table, 'column')
+        for start, stop in _mask_runs(mask):
+            areas.add(x, y + start, selector.width, area.height, stop - start)
         return areas
 
+    areas = Areas()
+    for col in _matched(mask):
+        areas.append(Area(table=area.table, width=selector.width,
+                          height=area.height, position=(x, y + col)))
+    return areas
 
-class CellSelector(object):
-    def __init__(self, func):
-        self.func = func
 
-    def select(self, area):
-        cells = Cells()
-        for row in area.data:
-            for cell in row:
-                if self.func(cell):
-                    cells.append(cell)
+def _select_rows(selector, area, mask, compact):
+    x, y = area.position
+    if compact:
+        areas = AreaSet(area.table, 'row')
+        for start, stop in _mask_runs(mask):
+            areas.add(x + start, y, area.width, selector.height, stop - start)
+        return areas
+
+    areas = Areas()
+    for row in _matched(mask):
+        areas.append(Area(table=area.table, width=area.width,
+                          height=selector.height, position=(x + row, y)))
+    return areas
+
+
+def _select_cells(selector, area, mask, compact):
+    x, y = area.position
+    if compact:
+        areas = AreaSet(area.table, 'row')
+        for col_num, column in enumerate(mask):
+            for start, stop in _mask_runs(column):
+                areas.add(x + start, y + col_num, 1, 1, stop - start)
+        return areas
+
+    cells = Cells()
+    for row_num in range(area.height):
+        row = area.table[x + row_num]
+        for col_num, column in enumerate(mask):
+            if column[row_num]:
+                cells.append(row[y + col_num])
+    return cells
+
 
-        return cells
+_SELECT = {
+    'column': _select_columns,
+    'row': _select_rows,
+    'cell': _select_cells,
+}
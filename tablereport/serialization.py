@@ -0,0 +1,227 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Binary serialization of built tables, see ``Table.dump`` and ``Table.load``.
+
+A dumped table is a small header followed by sections::
+
+    magic, version, the byte size of each section
+    meta:   width, height, the header and body areas, the row ranges of the
+            merged cells, the total rows and the indexes of the table style
+            and of the default style
+    styles: the distinct styles of the cells
+    values: the values of the cells, row by row, None for the covered cells
+    cell styles: an ``array('i')`` of the style index of each cell, -1 for
+            the covered cells
+    spans:  (cell index, width, height) of the merged cells
+
+Sections are written with ``marshal``, or with ``pickle`` when they hold
+values ``marshal`` does not support, such as dates or decimals. Loading a
+table unpickles its sections, which can run arbitrary code, so only files
+from trusted sources may be loaded.
+"""
+from __future__ import unicode_literals
+
+import io
+import marshal
+import mmap
+import struct
+import sys
+from array import array
+
+import six
+from six.moves import cPickle as pickle
+
+from .rows import RowStore
+from .style import _default_style
+from .tablereport import _paused_gc
+
+MAGIC = b'TRPT'
+VERSION = 1
+
+_HEADER = struct.Struct(str('<4sB5Q'))
+_MARSHAL, _PICKLE = b'm', b'p'
+
+
+def dump(table, file):
+    """write ``table`` into the binary file-like object ``file``"""
+    rows = table.data
+    styles = []
+    # id -> index of the distinct styles, whose references are kept by
+    # ``styles`` so that the ids are not reused
+    style_nums = {}
+
+    def style_num(style):
+        try:
+            return style_nums[id(style)]
+        except KeyError:
+            style_nums[id(style)] = len(styles)
+            styles.append(style)
+            return len(styles) - 1
+
+    table_style = style_num(table.style)
+    values = []
+    cell_styles = array(str('i'))
+    spans = []
+    for row in rows:
+        for cell in row:
+            if cell is None:
+                values.append(None)
+                cell_styles.append(-1)
+                continue
+            values.append(cell.value)
+            cell_styles.append(style_num(cell.style))
+            if cell.width != 1 or cell.height != 1:
+                spans.append((len(values) - 1, cell.width, cell.height))
+
+    meta = (table.width, table.height,
+            _area_position(table.header), _area_position(table.body),
+            table.areas.spans(), table._total_rows, table_style,
+            style_nums.get(id(_default_style), -1))
+    if sys.byteorder != 'little':
+        cell_styles.byteswap()
+    sections = [_dumps(meta), _dumps(styles), _dumps(values),
+                _tobytes(cell_styles), _dumps(spans)]
+
+    file.write(_HEADER.pack(MAGIC, VERSION,
+                            *[len(section) for section in sections]))
+    for section in sections:
+        file.write(section)
+
+
+def load(file):
+    """
+    Read a table written by ``dump`` from the binary file-like ``file``.
+
+    The sections are read with ``pickle`` and ``marshal``, which are not
+    secure against malicious data: only load files from trusted sources.
+    """
+    try:
+        position = file.tell()
+    except (AttributeError, IOError, io.UnsupportedOperation):
+        position = None
+    buffer, start, close = _open(file)
+    try:
+        magic, version = _HEADER.unpack_from(buffer, start)[:2]
+        if magic != MAGIC:
+            raise ValueError('not a dumped table')
+        if version != VERSION:
+            raise ValueError('unsupported version: {}'.format(version))
+
+        sizes = _HEADER.unpack_from(buffer, start)[2:]
+        offset = start + _HEADER.size
+        sections = []
+        for size in sizes:
+            sections.append(_section(buffer, offset, offset + size))
+            offset += size
+
+        (width, height, header, body, merged, total_row_nums, table_style,
+         default_style) = _loads(sections[0])
+        styles = _loads(sections[1])
+        values = _loads(sections[2])
+        cell_styles = array(str('i'))
+        _frombytes(cell_styles, sections[3])
+        spans = _loads(sections[4])
+        del sections
+    finally:
+        close()
+    # leave the file at the end of the table, as ``dump`` does
+    if position is not None:
+        file.seek(position + offset - start)
+
+    if sys.byteorder != 'little':
+        cell_styles.byteswap()
+    # the cells created without a style keep sharing the default one
+    if default_style != -1:
+        styles[default_style] = _default_style
+    with _paused_gc():
+        return _build(width, height, header, body, merged, total_row_nums,
+                      styles[table_style], values, cell_styles, styles, spans)
+
+
+def _build(width, height, header, body, merged, total_row_nums, style,
+           values, cell_styles, styles, spans):
+    from .tablereport import Cell, Table
+
+    # the covered cells have the style -1, the last item
+    styles = styles + [None]
+    cells = [None if cell_style is None else Cell(value, cell_style)
+             for value, cell_style in zip(values,
+                                          map(styles.__getitem__,
+                                              cell_styles))]
+    for index, cell_width, cell_height in spans:
+        cell = cells[index]
+        cell.width = cell_width
+        cell.height = cell_height
+
+    table = Table(style=style, columnar=False)
+    table._data = RowStore([[cells[row_num * width:(row_num + 1) * width]
+                             for row_num in range(height)]])
+    table.width = width
+    table.height = height
+    table._total_rows = total_row_nums
+    for area, (x, y, area_width, area_height) in ((table.header, header),
+                                                  (table.body, body)):
+        area.position = x, y
+        area.width = area_width
+        area.height = area_height
+    # the merged cells keep growing with the rows inserted into them
+    table.areas.add_spans(merged)
+    return table
+
+
+def _area_position(area):
+    x, y = area.position
+    return x, y, area.width, area.height
+
+
+def _dumps(value):
+    try:
+        return _MARSHAL + marshal.dumps(value)
+    except ValueError:
+        return _PICKLE + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _loads(section):
+    kind, data = section[:1], section[1:]
+    if kind == _MARSHAL:
+        return marshal.loads(data)
+    if kind == _PICKLE:
+        return pickle.loads(data)
+    raise ValueError('corrupted section')
+
+
+def _open(file):
+    """
+    Return the buffer the table is read from, the offset of the table in it
+    and a function closing the buffer. Files on disk are memory-mapped rather
+    than read.
+    """
+    try:
+        fileno = file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return file.read(), 0, lambda: None
+
+    mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    return mapped, file.tell(), mapped.close
+
+
+if six.PY2:
+    def _section(buffer, start, stop):
+        return buffer[start:stop]
+
+    def _tobytes(values):
+        return values.tostring()
+
+    def _frombytes(values, data):
+        values.fromstring(data)
+else:
+    def _section(buffer, start, stop):
+        # slices of the memory-mapped file are not copied
+        return memoryview(buffer)[start:stop]
+
+    def _tobytes(values):
+        return values.tobytes()
+
+    def _frombytes(values, data):
+        values.frombytes(data)
@@ -1,9 +1,18 @@
+import io
+import weakref
+
+import six
 from openpyxl import Workbook
 
-from .writer import WorkSheetWriter
+from .writer import (CsvWriter, WorkSheetWriter, WorkbookWriter, XlsxCache,
+                     XlsxWriter)
+
+# table -> (filename, XlsxCache) of its last incremental export
+_caches = weakref.WeakKeyDictionary()
 
 
-def write_to_excel(filename, table, position=(0, 0)):
+def write_to_excel(filename, table, position=(0, 0), write_only=False,
+                   engine='openpyxl', estimator=None, incremental=False):
     """write table into excel. 
     
     If the file does not exist, a new file will be created. If the file has already
@@ -11,9 +20,71 @@ def write_to_excel(filename, table, position=(0, 0)):
     
     By default, the table will be written in default worksheet at position (0,0).
     You can change the position by setting ``position`` argument.
+
+    With ``write_only=True``, the rows are streamed into a write-only workbook
+    instead of building the whole worksheet in memory.
+
+    With ``engine='xml'``, the worksheet is generated by ``XlsxWriter``
+    instead of openpyxl, which is several times faster and always streamed.
+
+    The automatic widths of the columns are measured by ``estimator``, see
+    ``WidthEstimator``.
+
+    With ``incremental=True``, the file is written by ``XlsxWriter`` with an
+    ``XlsxCache`` kept for the table, whose changes are tracked from then on,
+    so that the next incremental exports of the table into the same file
+    only generate the rows changed in the meantime.
+    """
+    if incremental:
+        filename_cache = _caches.get(table)
+        if filename_cache is None or filename_cache[0] != filename:
+            filename_cache = _caches[table] = filename, XlsxCache()
+        with XlsxWriter(filename, filename_cache[1]) as writer:
+            writer.add_sheet(table, position=position, estimator=estimator)
+        return
+
+    if engine == 'xml':
+        with XlsxWriter(filename) as writer:
+            writer.add_sheet(table, position=position, estimator=estimator)
+        return
+    if engine != 'openpyxl':
+        raise ValueError('unknown engine: {}'.format(engine))
+
+    wb = Workbook(write_only=write_only)
+    ws = wb.create_sheet() if write_only else wb.active
+    WorkSheetWriter.write(ws, table, position, estimator)
+
+    wb.save(filename)
+
+
+def write_workbook(filename, sheets, processes=None, write_only=False):
+    """write several tables into the worksheets of one excel file.
+
+    ``sheets`` is a list of ``(title, table, position)``. Tables can also be
+    given as picklable functions building them, which are then built and
+    prepared for writing in a pool of ``processes`` processes, see
+    ``WorkbookWriter.write``.
     """
-    wb = Workbook()
-    ws = wb.active
-    WorkSheetWriter.write(ws, table, position)
+    wb = Workbook(write_only=write_only)
+    if not write_only:
+        wb.remove(wb.active)
+    WorkbookWriter.write(wb, sheets, processes)
 
     wb.save(filename)
+
+
+def write_to_csv(filename, table, merged='repeat', dialect='excel',
+                 **fmtparams):
+    """write table into a UTF-8 csv file, or a tsv one with
+    ``dialect='excel-tab'``.
+
+    The values of merged cells are repeated over the cells they cover, unless
+    ``merged`` is ``'first'`` or ``'blank'``, see ``CsvWriter``.
+    """
+    if six.PY2:
+        file = open(filename, 'wb')
+    else:
+        file = io.open(filename, 'w', newline='', encoding='utf-8')
+    with file:
+        CsvWriter.write(file, table, merged=merged, dialect=dialect,
+                        **fmtparams)
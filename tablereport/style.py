@@ -2,31 +2,122 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
 
-class Style(object):
+_DEFAULTS = {
+    'font_size': 12,
+    'height': 'auto',
+    'width': 'auto',
+    'horizontal_align': 'center',
+    'vertical_align': 'center',
+}
+
+class Style(Mapping):
     """
-    Style and style check is here
+    Style and style check is here.
+
+    A style is an immutable mapping of the attributes given, on top of the
+    attributes of the style it extends (the default attributes by default)::
+
+        title_style = Style({'font_weight': 'blod'})
+        red_title_style = Style({'background_color': 'ffff0000'},
+                                extend=title_style)
+
+    A style only keeps a link to the style it extends, and the attributes are
+    resolved the first time they are read. As styles never change, they can
+    be shared by any number of cells, and the styles with the same attributes
+    have the same ``id`` and hash. A style is equal to a dict of the same
+    attributes.
     """
+    __slots__ = ('_parent', '_attributes', '_resolved', '_id')
 
-    def __new__(cls, dict_1=None, extend=None):
+    def __init__(self, dict_1=None, extend=None):
         if dict_1 is None:
             dict_1 = {}
         else:
-            assert isinstance(dict_1, dict)
+            assert isinstance(dict_1, Mapping)
 
-        if extend is not None:
-            assert isinstance(extend, dict)
+        if extend is None:
+            extend = _root
         else:
-            extend = {
-                'font_size': 12,
-                'height': 'auto',
-                'width': 'auto',
-                'horizontal_align': 'center',
-                'vertical_align': 'center',
-            }
-        extend = extend.copy()
-        extend.update(dict_1)
-        return extend
+            assert isinstance(extend, Mapping)
+            if not isinstance(extend, Style):
+                extend = Style(extend, {}) if extend else None
+        self._parent = extend
+        self._attributes = dict(dict_1)
+        self._resolved = None
+        self._id = None
+
+    @property
+    def parent(self):
+        """the style extended by the style"""
+        return self._parent
+
+    def _resolve(self):
+        resolved = self._resolved
+        if resolved is None:
+            if self._parent is None:
+                resolved = self._attributes
+            elif not self._attributes:
+                # nothing to add to the parent, whose dict is never modified
+                resolved = self._parent._resolve()
+            else:
+                resolved = dict(self._parent._resolve())
+                resolved.update(self._attributes)
+            self._resolved = resolved
+        return resolved
+
+    @property
+    def id(self):
+        """
+        A key of the attributes, the same for all the styles with the same
+        attributes: the frozenset of their items.
+        """
+        if self._id is None:
+            self._id = frozenset(self._resolve().items())
+        return self._id
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+    def get(self, name, default=None):
+        return self._resolve().get(name, default)
+
+    def __contains__(self, name):
+        return name in self._resolve()
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, Style):
+            return self._resolve() == other._resolve()
+        if isinstance(other, Mapping):
+            return self._resolve() == dict(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return 'Style({!r})'.format(self._resolve())
+
+    def __reduce__(self):
+        return Style, (self._attributes, {} if self._parent is None
+                       else self._parent)
 
 
+_root = Style(_DEFAULTS, {})
 _default_style = Style()
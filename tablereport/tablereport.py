@@ -2,6 +2,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import bisect
+import collections
+import gc
+import itertools
+from contextlib import contextmanager
+
+try:
+    from collections.abc import MutableSet
+except ImportError:  # Python 2
+    from collections import MutableSet
+
+from .aggregate import get_aggregate
+from .instrument import instrumented, _counts, _hooks
+from .interval import AreaIndex
+from .rows import RowStore
 from .style import _default_style
 
 
@@ -47,9 +62,32 @@ class Table(object):
         [[Cell('test', width=2), None],
         [Cell('header1'), Cell('header2')],
         [Cell(1), Cell(2)]]
+
+    For large tables, ``columnar=True`` stores the data column by column, with
+    numeric columns kept in typed arrays. Rows and cells are then created on
+    demand when they are accessed, and modifying them modifies the table. The
+    rows given to a columnar table are only read, and are neither copied nor
+    kept.
+
+    Otherwise, the header and body are copied row by row, so that the lists
+    given are left as they are, which costs a list per row. With ``copy=False``, the
+    values of the rows given are wrapped into cells in place, and the table
+    keeps the header and body lists as its storage, which saves copying a
+    large body: the rows inserted into the table are then inserted into the
+    body list too. The body list is not split into blocks as the rows of the
+    table are (see ``RowStore``), so that each row inserted by a summary
+    moves the rows below it in the list, which is slower for a large body
+    with many summaries.
+
+    The areas of a table, such as the ones returned by ``select`` and
+    ``group``, move and grow with the rows inserted by summaries. The table
+    only holds weak references to them, and forgets the areas which are no
+    longer referenced elsewhere, while the merged cells keep growing with the
+    rows inserted into them.
     """
 
-    def __init__(self, header=None, body=None, style=None):
+    def __init__(self, header=None, body=None, style=None, columnar=False,
+                 copy=True):
         if header is None:
             header = []
 
@@ -58,90 +96,559 @@ class Table(object):
 
         if style is None:
             style = _default_style
-        self._flag = []
-        self._header_data = header
-        self._body_data = body
-        self._data = self._header_data + self._body_data
 
-        for row_num in range(len(self._data)):
-            for col_num in range(len(self._data[0])):
-                cell = self._data[row_num][col_num]
-                if cell is not None:
-                    if isinstance(cell, tuple):
-                        self._data[row_num][col_num] = Cell(cell[0],
-                                                            style=cell[1])
-                    else:
-                        self._data[row_num][col_num] = Cell(
-                            self._data[row_num][col_num],
-                            style=style)
-                    self._auto_merge(self._data, row_num, col_num, self._flag)
-        self.areas = []
-        self.total_row_nums = set()
+        # the columnar storage only reads the rows given
+        if copy and not columnar:
+            header = [list(row) for row in header]
+            body = [list(row) for row in body]
+
         try:
-            width = len(self._data[0])
+            width = len((header or body)[0])
         except IndexError:
             width = 0
 
+        if columnar:
+            from .columnar import ColumnarStorage
+            self._data = ColumnarStorage(RowStore([header, body]), width,
+                                         style)
+        else:
+            self._data = RowStore([header, body], shared=not copy)
+            self._wrap_cells(self._data, width, style)
+        header_height, body_height = len(header), len(body)
+
+        self.areas = AreaIndex()
+        # the sorted numbers of the summary rows
+        self._total_rows = []
+        self.changes = None
+        self._batch_depth = 0
+        self._pending_nums = []
+        self._pending_rows = []
+
         self.width = width
         self.height = len(self._data)
         self.style = style
         self.header = Area(table=self, width=self.width,
-                           height=len(self._header_data),
-                           position=(0, 0))
-        self.body = Area(table=self, width=self.width,
-                         height=len(self._body_data),
-                         position=(len(self._header_data), 0))
+                           height=header_height, position=(0, 0))
+        self.body = Area(table=self, width=self.width, height=body_height,
+                         position=(header_height, 0))
+
+    @staticmethod
+    def from_iterable(body, header=None, style=None, chunk_size=1000):
+        """
+        Create a ``LazyTable`` whose body is pulled from an iterable, such as
+        a generator or a DB-API cursor, ``chunk_size`` rows at a time.
+        """
+        return LazyTable(body, header, style, chunk_size)
+
+    @staticmethod
+    @instrumented('Table.group_by')
+    def group_by(body, keys=1, header=None, style=None, label='Total',
+                 label_span=None, subtotal_levels=None, total=True,
+                 label_style=None, value_style=None, total_label_style=None,
+                 total_value_style=None, aggregate='sum', sort=True):
+        """
+        Create a table whose body rows are grouped by their first ``keys``
+        columns, with the cells of each key merged and a subtotal row after
+        each group, in one pass over the rows::
+
+            table = Table.group_by(body=[['One', 'A', 1, 2],
+                                         ['Two', 'B', 2, 3],
+                                         ['One', 'B', 3, 4]],
+                                   header=[['H1', 'H2', 'H3', 'H4']])
+
+        gives the same table as::
+
+            table = Table(header=[['H1', 'H2', 'H3', 'H4']],
+                          body=[['One', 'A', 1, 2],
+                                ['One', 'B', 3, 4],
+                                ['Two', 'B', 2, 3]])
+            column = table.body.select(ColumnSelector(lambda col: col == 1))
+            column.group().merge().left.summary(label_span=1, label='Total')
+            table.summary(label_span=2, label='Total')
+
+        The columns after the first ``label_span`` ones (by default the keys
+        and one more column) are summarized by ``aggregate``, which can also
+        be a list of aggregates, one per summarized column. The labels of the
+        subtotal rows span the columns from their key to the summarized ones.
+        ``subtotal_levels`` are the numbers of the keys (0 for the first one)
+        whose groups have a subtotal row, all of them by default, and
+        ``total`` adds the total row.
+
+        The rows are sorted by their keys, unless ``sort='hash'``, which keeps
+        the groups in the order of their first rows, or ``sort=False`` if the
+        rows of each group are already next to each other. They are then
+        wrapped into cells as for ``Table``: ``(value, style)`` entries set
+        the styles of their cells, and ``None`` merges cells, which are only
+        summarized once. The keys themselves must not be ``None``.
+        """
+        from .pivot import group_by
+        return group_by(body, keys, header, style, label, label_span,
+                        subtotal_levels, total, label_style, value_style,
+                        total_label_style, total_value_style, aggregate, sort)
+
+    def dump(self, file):
+        """
+        Write the table into a binary file, in a compact format which ``load``
+        reads much faster than the cells would be unpickled. The format is
+        meant for caching built tables, eg: between the workers of
+        ``write_workbook``, as it depends on the version of Python.
+        """
+        from .serialization import dump
+        dump(self, file)
+
+    @staticmethod
+    def load(file):
+        """
+        Read a table written by ``dump`` from a binary file, which is
+        memory-mapped if it is on disk. The table is always loaded into list
+        storage, and only its header and body areas are kept.
+
+        The file is read with ``pickle`` and ``marshal``, which can run
+        arbitrary code: only load files from trusted sources.
+        """
+        from .serialization import load
+        return load(file)
+
+    @staticmethod
+    def _wrap_cells(rows, width, style, resolver=None):
+        if resolver is None:
+            resolver = _SpanResolver(width)
+        for row in rows:
+            for col_num in range(width):
+                cell = row[col_num]
+                if cell is not None:
+                    if isinstance(cell, tuple):
+                        row[col_num] = Cell(cell[0], style=cell[1])
+                    else:
+                        row[col_num] = Cell(cell, style=style)
+            resolver.feed(row)
+
+    def iter_rows(self):
+        """iterate the rows of the table"""
+        if self._pending_nums:
+            for row_num in range(self.height):
+                yield self[row_num]
+        else:
+            for row in self._data:
+                yield row
 
     @property
     def data(self):
+        self._apply_pending()
         return self._data
 
     def __getitem__(self, item):
+        if isinstance(item, slice):
+            self._apply_pending()
+        elif self._pending_nums:
+            index = self._pending_index(item)
+            if isinstance(index, tuple):
+                return self._pending_rows[index[0]]
+            item = index
         return self._data[item]
 
     def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            self._apply_pending()
+            if self.changes is not None:
+                self.changes.rows.update(range(*key.indices(len(self._data))))
+            self._data[key] = value
+            return
+        if self.changes is not None:
+            self.changes.rows.add(key)
+        if self._pending_nums:
+            index = self._pending_index(key)
+            if isinstance(index, tuple):
+                self._pending_rows[index[0]] = value
+                return
+            key = index
         self._data[key] = value
 
-    def select(self, selector):
+    @property
+    def total_row_nums(self):
+        """the numbers of the summary rows added to the table"""
+        return _TotalRowNums(self)
+
+    @total_row_nums.setter
+    def total_row_nums(self, row_nums):
+        self._total_rows = sorted(row_nums)
+
+    def track_changes(self):
+        """
+        Track the changes made to the table from now on, and return them as a
+        ``Changes``. ``write_to_excel(..., incremental=True)`` uses them to
+        only rewrite the rows changed since the table was last written.
+
+        The rows and cells of a tracked table are replaced by copies which
+        mark themselves as changed when they are set, so that the changes
+        must be made to the rows and cells of the table, and not to the ones
+        it was given or returned before being tracked.
+        """
+        if self.changes is None:
+            from .changes import Changes
+            self.changes = Changes()
+            if not isinstance(self._data, RowStore):
+                self._data.changes = self.changes
+        self.changes.clear(self)
+        return self.changes
+
+    @contextmanager
+    def batch(self):
+        """
+        Defer the rows inserted by bottom summaries until the end of the block,
+        where they are inserted into the table data in one pass::
+
+            with table.batch():
+                areas.left.summary(label_span=1, label='total')
+                table.summary(label_span=2, label='total')
+
+        Inside the block, the table can be read and modified as usual, slices
+        of rows inserting the deferred rows first.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._apply_pending()
+
+    def _pending_index(self, row_num):
+        """
+        Translate a row number into ``(index,)`` of a pending row, or into the
+        row number in ``self._data``.
+        """
+        if row_num < 0:
+            row_num += len(self._data) + len(self._pending_nums)
+        index = bisect.bisect_left(self._pending_nums, row_num)
+        if index < len(self._pending_nums) \
+                and self._pending_nums[index] == row_num:
+            return index,
+        return row_num - index
+
+    def _insert_row(self, row_num, row):
+        _counts['rows'] += 1
+        if self.changes is not None:
+            self.changes.insert(row_num)
+        # the summary rows below move down, or the summaries of the outer
+        # groups would count the subtotals of the inner ones
+        totals = self._total_rows
+        index = bisect.bisect_left(totals, row_num)
+        if index < len(totals):
+            totals[index:] = [num + 1 for num in totals[index:]]
+        if not self._batch_depth:
+            self._data.insert(row_num, row)
+            return
+
+        nums = self._pending_nums
+        index = bisect.bisect_left(nums, row_num)
+        for i in range(index, len(nums)):
+            nums[i] += 1
+        nums.insert(index, row_num)
+        self._pending_rows.insert(index, row)
+
+    def _reorder_rows(self, start, order):
+        """move the row ``start + order[i]`` to ``start + i``, for each i"""
+        self._apply_pending()
+        stop = start + len(order)
+        if self.changes is not None:
+            self.changes.rows.update(range(start, stop))
+        self._data.reorder_rows(start, order)
+
+    def _check_movable(self, start, stop):
+        """
+        Raise a ValueError if the rows from ``start`` to ``stop`` can't be
+        moved as a whole, as they hold total rows or cells merged across rows.
+        """
+        totals = self._total_rows
+        index = bisect.bisect_left(totals, start)
+        if index < len(totals) and totals[index] < stop:
+            raise ValueError('the total row {} cannot be moved'.format(
+                totals[index]))
+        for x, height, y, _ in self.areas.spans_between(start, stop):
+            # the ranges of the cells unmerged since then are still indexed
+            cell = self[x][y]
+            if height > 1 and cell is not None and cell.height > 1:
+                raise ValueError('the row {} holds cells merged across rows, '
+                                 'and cannot be moved'.format(max(x, start)))
+
+    def _apply_pending(self):
+        if not self._pending_nums:
+            return
+
+        nums, rows = self._pending_nums, self._pending_rows
+        self._pending_nums, self._pending_rows = [], []
+        self._data.insert_rows(nums, rows)
+
+    def _column_reader(self, row_nums):
+        """
+        Return a function reading the values of a column in the (sorted)
+        ``row_nums``.
+        """
+        if not isinstance(self._data, RowStore):
+            physical_nums = [self._pending_index(row_num)
+                             for row_num in row_nums] \
+                if self._pending_nums else row_nums
+            if not any(isinstance(num, tuple) for num in physical_nums):
+                runs = _runs(physical_nums)
+                return lambda col_num: self._data.column_values(col_num, runs)
+
+        rows = [self[row_num] for row_num in row_nums]
+        return lambda col_num: [row[col_num].value for row in rows]
+
+    def _column_values(self, col_num, start, stop):
+        """
+        Values of a column from the row ``start`` to ``stop``, with ``None``
+        for the cells covered by merged ones.
+        """
+        if not isinstance(self._data, RowStore) and not self._pending_nums:
+            return self._data.column_values(col_num, [(start, stop)])
+
+        rows = self._data[start:stop] if not self._pending_nums \
+            else [self[row_num] for row_num in range(start, stop)]
+        return [None if row[col_num] is None else row[col_num].value
+                for row in rows]
+
+    def _insert_column(self, col_num):
+        self._apply_pending()
+        if self.changes is not None:
+            self.changes.insert(0)
+        if isinstance(self._data, RowStore):
+            for row in self._data:
+                row.insert(col_num, None)
+        else:
+            self._data.insert_column(col_num)
+
+    @instrumented('Table.select')
+    def select(self, selector, compact=False):
         # select an area in self
         table = Area(table=self, width=self.width, height=self.height,
                      position=(0, 0))
+        if compact:
+            return selector.select(table, compact=True)
         areas = selector.select(table)
         return areas
 
+    @instrumented('Table.summary')
     def summary(self, label, label_span, location='bottom', label_style=None,
-                value_style=None):
-        self.body.summary(label, label_span, location, label_style, value_style)
+                value_style=None, aggregate='sum'):
+        self.body.summary(label, label_span, location, label_style, value_style,
+                          aggregate)
 
-    @staticmethod
-    def _auto_merge(data, row_num, col_num, flag):
 
-        for i in range(row_num + 1, len(data)):
-            if data[i][col_num] is None:
-                data[row_num][col_num].height += 1
-                flag.append((i, col_num))
-            else:
-                break
+class LazyTable(object):
+    """
+    A table whose body is only pulled from its source when its rows are
+    iterated, so that the whole body never has to be in memory at once::
+
+        cursor.execute('SELECT region, kind, amount FROM sales')
+        table = Table.from_iterable(cursor, header=[['Region', 'Kind',
+                                                     'Amount']])
+        write_to_excel('sales.xlsx', table, write_only=True)
+
+    Rows are fetched ``chunk_size`` at a time, with ``fetchmany`` if the
+    source has it, and their values are wrapped into cells as for ``Table``.
+    The rows of a lazy table can only be iterated once, and it does not
+    support selecting or summarizing.
+    """
+
+    def __init__(self, body, header=None, style=None, chunk_size=1000):
+        if header is None:
+            header = []
+
+        if style is None:
+            style = _default_style
+        self.style = style
+        self.chunk_size = chunk_size
+        self._header_data = header
+        self._body = body
+        self._chunks = self._fetch_chunks()
+        self._first_chunk = next(self._chunks, [])
+        self._head = None
+        self._iterated = False
+        # the number of rows iterated so far, only counted for the
+        # instrumentation, while it is active
+        self._rows_iterated = 0
 
-        for j in range(col_num + 1, len(data[0])):
-            if data[row_num][j] is None and (row_num, j) not in flag:
-                data[row_num][col_num].width += 1
+        try:
+            self.width = len((header or self._first_chunk)[0])
+        except IndexError:
+            self.width = 0
+        self._resolver = _SpanResolver(self.width)
+
+    def _fetch_chunks(self):
+        fetchmany = getattr(self._body, 'fetchmany', None)
+        rows = iter(self._body) if fetchmany is None else None
+        while True:
+            if fetchmany is not None:
+                chunk = fetchmany(self.chunk_size)
             else:
-                break
+                chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _wrap(self, rows):
+        rows = [list(row) for row in rows]
+        Table._wrap_cells(rows, self.width, self.style, self._resolver)
+        return rows
+
+    def head(self):
+        """the header rows and the first chunk of the body"""
+        if self._head is None:
+            self._head = self._wrap(itertools.chain(self._header_data,
+                                                    self._first_chunk))
+            self._first_chunk = None
+        return self._head
+
+    def iter_rows(self):
+        """
+        Iterate the rows of the table. The span of a cell may still grow with
+        the ``None`` of the rows which have not been iterated yet.
+        """
+        if self._iterated:
+            raise ValueError('the rows of a lazy table can only be iterated '
+                             'once')
+        self._iterated = True
+
+        head = self.head()
+        self._head = []
+        chunks = itertools.chain([head], (self._wrap(chunk)
+                                          for chunk in self._chunks))
+        for rows in chunks:
+            if _hooks:
+                self._rows_iterated += len(rows)
+            for row in rows:
+                yield row
+
+
+def _runs(nums):
+    """group sorted integers into ``(start, stop)`` ranges"""
+    runs = []
+    for num in nums:
+        if runs and runs[-1][1] == num:
+            runs[-1][1] += 1
+        else:
+            runs.append([num, num + 1])
+    return runs
+
+
+class _TotalRowNums(MutableSet):
+    """
+    The numbers of the summary rows of a table, as a set reading and writing
+    the sorted list kept by the table.
+    """
+    __slots__ = ('table',)
+
+    def __init__(self, table):
+        self.table = table
+
+    def __contains__(self, row_num):
+        row_nums = self.table._total_rows
+        index = bisect.bisect_left(row_nums, row_num)
+        return index < len(row_nums) and row_nums[index] == row_num
+
+    def __iter__(self):
+        return iter(self.table._total_rows)
+
+    def __len__(self):
+        return len(self.table._total_rows)
+
+    def add(self, row_num):
+        if row_num not in self:
+            bisect.insort(self.table._total_rows, row_num)
+
+    def discard(self, row_num):
+        if row_num in self:
+            row_nums = self.table._total_rows
+            del row_nums[bisect.bisect_left(row_nums, row_num)]
+
+    def __repr__(self):
+        return '{{{}}}'.format(', '.join(map(repr, self)))
+
+
+@contextmanager
+def _paused_gc():
+    """
+    Pause the garbage collector while creating many cells: cells hold no
+    cycles, but creating them triggers collections which traverse all the
+    cells created so far over and over.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class _SpanResolver(object):
+    """
+    Resolve the spans of cells auto merged by ``None`` in one pass.
+
+    Rows are fed from top to bottom. A ``None`` extends the nearest cell above
+    it in the same column if there is one, otherwise it extends the cell on its
+    left, unless the run of ``None`` between them has been broken by a cell
+    which is already merged vertically.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self._above = [None] * width
+
+    def feed(self, row):
+        above = self._above
+        left = None
+        for col_num in range(self.width):
+            cell = row[col_num]
+            if cell is not None:
+                above[col_num] = left = cell
+            elif above[col_num] is not None:
+                above[col_num].height += 1
+                left = None
+            elif left is not None:
+                left.width += 1
 
 
 class Cell(object):
+    # tables hold a cell per value, so cells have no ``__dict__``. Cells
+    # created without a style all share the default one, and the width and
+    # height of the cells which are not merged are not stored.
+    __slots__ = ('value', 'style', '_span')
+
     def __init__(self, value, style=None, width=1, height=1):
         self.value = value
-        self.width = width
-        self.height = height
+        self._span = None if width == 1 and height == 1 else (width, height)
         if style is None:
             style = _default_style
         self.style = style
 
+    @property
+    def width(self):
+        span = self._span
+        return 1 if span is None else span[0]
+
+    @width.setter
+    def width(self, width):
+        self._set_span(width, self.height)
+
+    @property
+    def height(self):
+        span = self._span
+        return 1 if span is None else span[1]
+
+    @height.setter
+    def height(self, height):
+        self._set_span(self.width, height)
+
+    def _set_span(self, width, height):
+        self._span = None if width == 1 and height == 1 else (width, height)
+
     def __eq__(self, other):
-        if type(other) == Cell:
-            return self.__dict__ == other.__dict__
+        if isinstance(other, Cell):
+            return ((self.value, self.width, self.height, self.style) ==
+                    (other.value, other.width, other.height, other.style))
         else:
             assert type(self.value) == type(other)
             return self.value == other
@@ -159,30 +666,45 @@ class Cells(list):
             areas = []
         super(Cells, self).__init__(areas)
 
+    @instrumented('Cells.set_style')
     def set_style(self, style):
         for cell in self:
             cell.style = style
 
 
 class Area(object):
+    __slots__ = ('table', '_y', '_node', 'width', 'style', '__weakref__')
+
     def __init__(self, table, width, height, position, style=None):
+        _counts['areas'] += 1
         self.table = table
-        self.table.areas.append(self)
+        x, self._y = position
+        self._node = self.table.areas.add(self, x, height)
 
         self.width = width
-        self.height = height
-
-        self._x, self._y = position
 
         self.style = style
 
+    @property
+    def _x(self):
+        return self.table.areas.start(self._node)
+
+    @property
+    def height(self):
+        return self.table.areas.height(self._node)
+
+    @height.setter
+    def height(self, value):
+        self.table.areas.set_height(self._node, value)
+
     @property
     def position(self):
         return self._x, self._y
 
     @position.setter
     def position(self, value):
-        self._x, self._y = value
+        x, self._y = value
+        self.table.areas.move(self._node, x)
 
     @property
     def data(self):
@@ -202,156 +724,73 @@ class Area(object):
         area = Area(self.table, width, self.height, position, style=None)
         return area
 
-    def select(self, selector):
-        # select an area in self
+    @instrumented('Area.select')
+    def select(self, selector, compact=False):
+        """
+        Select areas in the area. With ``compact=True``, the selected areas
+        are returned as an ``AreaSet`` instead of ``Areas``.
+        """
+        if compact:
+            return selector.select(self, compact=True)
         area = selector.select(self)
         return area
 
-    def group(self):
-        """group a area, now only support group a col"""
-        if not self.width == 1:
-            return
-
-        start_index = 0
-        start_value = self.data[0][0]
-        start_x, start_y = self.position
-
+    @instrumented('Area.group')
+    def group(self, key=None, presorted=False, sort=False):
+        """group the rows of a area
+
+        Adjacent cells which are equal are grouped together. If ``key`` is
+        given, adjacent cells are grouped when ``key(cell)`` are equal. In an
+        area of several columns, the rows are grouped by the tuples of their
+        cells, which are passed to ``key``.
+
+        If the cells of the same group are known to be adjacent, such as in a
+        sorted column, ``presorted=True`` finds the end of each group by
+        binary search instead of comparing every cell.
+
+        Otherwise, ``sort=True`` sorts the rows of the table spanned by the
+        area by their values (or keys), ``None`` first, and ``sort='hash'``
+        moves the rows of each group after its first one, so that equal
+        values are grouped wherever they are. The rows are moved as a whole,
+        so a ValueError is raised if they hold total rows or cells merged
+        across rows.
+        """
+        x, y = self.position
         areas = Areas()
-        for row_num in range(1, len(self.data)):
-            if self.data[row_num][0] == start_value:
-                continue
-            else:
-                area = Area(table=self.table, width=1,
-                            height=row_num - start_index,
-                            position=(start_x + start_index, start_y))
-                start_value = self.data[row_num][0]
-                start_index = row_num
-                areas.append(area)
-        else:
-            sub_area = Area(table=self.table, width=1,
-                            height=len(self.data) - start_index,
-                            position=(start_x + start_index, start_y))
-            areas.append(sub_area)
+        for start, stop in _group_bounds(self.table, x, y, self.width,
+                                         self.height, key, presorted, sort):
+            area = Area(table=self.table, width=self.width,
+                        height=stop - start, position=(x + start, y))
+            areas.append(area)
         return areas
 
+    @instrumented('Area.merge')
     def merge(self, style=None):
-        cell = self.data[0][0]
-
-        for row in range(len(self.data)):
-            for col in range(len(self.data[0])):
-                self.data[row][col] = None
-        cell.height = len(self.data)
-        if style is not None:
-            cell.style = style
-
-        self.data[0][0] = cell
+        x, y = self.position
+        _merge(self.table, x, y, self.width, self.height, style)
 
+    @instrumented('Area.summary')
     def summary(self, label=None, label_span=0, location='bottom',
                 label_style=None,
-                value_style=None):
-        if location == 'bottom':
-            new_row_num = self._add_row_at_bottom(label_style, label,
-                                                  label_span, value_style)
-
-            self._update_existed_areas(new_row_num)
-            self.table.height += 1
-        elif location == 'right':
-            self._add_col_at_right(label_style, label, label_span, value_style)
-            # todo: update existed areas
-            self.table.width += 1
-        else:
-            raise NotImplemented
-
+                value_style=None, aggregate='sum'):
+        """
+        Add a summary row below the area or a summary column at its right.
+
+        ``aggregate`` is the name of a registered aggregate function ('sum',
+        'mean', 'count', 'min', 'max'...) or a function receiving the
+        sequence of values to summarize.
+        """
+        _summarize(self.table, self._x, self._y, self.width, self.height,
+                   label, label_span, location, label_style, value_style,
+                   aggregate)
+
+    @instrumented('Area.set_style')
     def set_style(self, style):
         for row in self.data:
             for cell in row:
                 if cell:
                     cell.style = style
 
-    def _update_existed_areas(self, new_row_num):
-        self_y = self.position[1]
-        self_width = self.width
-        for area in self.table.areas:
-            x, y = area.position
-            if new_row_num > x + area.height:
-                continue
-            elif x + area.height >= new_row_num > x:
-                # handle merged cell
-                cell = area[0][0]
-                if cell.width == area.width and cell.height == area.height:
-                    # todo
-                    if self_y <= y + area.width - 1 \
-                            and self_y + self_width - 1 >= y:
-                        pass
-                    else:
-                        cell.height += 1
-
-                area.height += 1
-
-            else:
-                x += 1
-                area.position = x, y
-
-    def _add_row_at_bottom(self, label_style, text, label_span, value_style):
-        new_row_num = self._x + self.height
-        self.table.data.insert(new_row_num,
-                               [None] * self.table.width)
-        appended_row = self.table[new_row_num]
-
-        # add label cell
-        if label_span != 0:
-            appended_row[self._y] = Cell(text, width=label_span)
-            if label_style is not None:
-                appended_row[self._y].style = label_style
-            else:
-                appended_row[self._y].style = self.table.style
-
-        # add summarized cells
-        # todo: not iterate to self.table.width
-        for col_num in range(self._y + label_span,
-                             self.table.width):
-            total = 0
-            for row_num in range(self._x, self._x + self.height):
-                if row_num in self.table.total_row_nums:
-                    continue
-                total += self.table[row_num][col_num].value
-            appended_row[col_num] = Cell(total)
-            if value_style is not None:
-                appended_row[col_num].style = value_style
-            else:
-                appended_row[col_num].style = self.table.style
-        self.table.total_row_nums.add(new_row_num)
-        return new_row_num
-
-    def _add_col_at_right(self, label_style, text, label_span, value_style):
-        new_col_num = self._y + self.width
-        for row in self.table.data:
-            row.insert(new_col_num, None)
-
-        appended_col = Column(table=self.table, position=(0, new_col_num),
-                              height=self.height)
-
-        # add label cell
-        if label_span != 0:
-            appended_col[self._x] = Cell(text, height=label_span)
-            if label_style is not None:
-                appended_col[self._x].style = label_style
-            else:
-                appended_col[self._x].style = self.table.style
-
-        # add summarized cells
-        for row_num in range(self._x + label_span, self._x + self.height):
-            total = 0
-            for col_num in range(self._y, self._y + self.width):
-                total += self.table[row_num][col_num].value
-            appended_col[row_num] = Cell(total)
-            if value_style is not None:
-                appended_col[row_num].style = value_style
-            else:
-                appended_col[row_num].style = self.table.style
-        self.table.total_row_nums.add(new_col_num)
-        return new_col_num
-
     def __getitem__(self, item):
         if item == self.height:
             raise IndexError
@@ -360,7 +799,7 @@ class Area(object):
     def __setitem__(self, key, value):
         if key == self.height:
             raise IndexError
-        self.table.data[key + self._x] = value
+        self.table[key + self._x] = value
 
 
 class Areas(list):
@@ -377,13 +816,15 @@ class Areas(list):
 
         return areas
 
-    def group(self):
+    @instrumented('Areas.group')
+    def group(self, key=None, presorted=False, sort=False):
         areas = Areas()
         for area in self:
-            areas.extend(area.group())
+            areas.extend(area.group(key, presorted, sort))
 
         return areas
 
+    @instrumented('Areas.merge')
     def merge(self, style=None):
         areas = Areas()
         for area in self:
@@ -392,12 +833,19 @@ class Areas(list):
 
         return areas
 
+    @instrumented('Areas.summary')
     def summary(self, label=None, label_span=0, location='bottom',
                 label_style=None,
-                value_style=None):
-        for area in self:
-            area.summary(label, label_span, location, label_style, value_style)
+                value_style=None, aggregate='sum'):
+        if not self:
+            return
 
+        with self[0].table.batch():
+            for area in self:
+                area.summary(label, label_span, location, label_style,
+                             value_style, aggregate)
+
+    @instrumented('Areas.set_style')
     def set_style(self, style):
         for area in self:
             area.set_style(style)
@@ -408,7 +856,375 @@ class Areas(list):
         return self[0]
 
 
+class AreaSet(object):
+    """
+    Areas of a table, stored as runs of areas repeated at a stride instead of
+    an ``Area`` per line, so that selecting and styling every other row of a
+    large table takes memory per run rather than per row.
+
+    Each run is ``(x, y, width, height, count, step)``: ``count`` areas of
+    ``width`` x ``height`` cells, the first one at ``(x, y)`` and the next
+    ones every ``step`` rows with ``axis='row'``, or every ``step`` columns
+    with ``axis='column'``.
+
+    Unlike areas, the runs are not moved by the rows inserted into the table,
+    except by the ones inserted by ``summary``.
+    """
+    __slots__ = ('table', 'axis', 'runs')
+
+    def __init__(self, table, axis, runs=None):
+        self.table = table
+        self.axis = axis
+        self.runs = []
+        for run in runs or ():
+            self.add(*run)
+
+    def add(self, x, y, width, height, count=1, step=1):
+        """add a run, joining it with the last one if it extends its stride"""
+        if self.runs:
+            last_x, last_y, last_width, last_height, last_count, last_step = \
+                self.runs[-1]
+            if self.axis == 'row':
+                same = (last_y, last_width, last_height) == (y, width, height)
+                gap = x - last_x - (last_count - 1) * last_step
+            else:
+                same = (last_x, last_width, last_height) == (x, width, height)
+                gap = y - last_y - (last_count - 1) * last_step
+            if same and gap > 0 and (last_count == 1 or gap == last_step) \
+                    and (count == 1 or gap == step):
+                self.runs[-1] = (last_x, last_y, last_width, last_height,
+                                 last_count + count, gap)
+                return
+        self.runs.append((x, y, width, height, count, step))
+
+    def __len__(self):
+        return sum(run[4] for run in self.runs)
+
+    def __repr__(self):
+        return 'AreaSet(axis={!r}, runs={!r})'.format(self.axis, self.runs)
+
+    def rectangles(self):
+        """iterate the ``(x, y, width, height)`` of the areas"""
+        for x, y, width, height, count, step in self.runs:
+            for index in range(count):
+                if self.axis == 'row':
+                    yield x + index * step, y, width, height
+                else:
+                    yield x, y + index * step, width, height
+
+    def to_areas(self):
+        """expand the set into ``Areas``"""
+        return Areas(Area(self.table, width, height, (x, y))
+                     for x, y, width, height in self.rectangles())
+
+    def _blocks(self):
+        # rectangles covering the areas, one per run when they are adjacent
+        for x, y, width, height, count, step in self.runs:
+            size = height if self.axis == 'row' else width
+            if count > 1 and step <= size:
+                length = (count - 1) * step
+                if self.axis == 'row':
+                    yield x, y, width, height + length
+                else:
+                    yield x, y, width + length, height
+                continue
+            for index in range(count):
+                if self.axis == 'row':
+                    yield x + index * step, y, width, height
+                else:
+                    yield x, y + index * step, width, height
+
+    def cells(self):
+        """iterate the cells of the areas, except the merged placeholders"""
+        table = self.table
+        for x, y, width, height in self._blocks():
+            for row_num in range(x, x + height):
+                row = table[row_num]
+                for col_num in range(y, y + width):
+                    cell = row[col_num]
+                    if cell is not None:
+                        yield cell
+
+    @property
+    def left(self):
+        """left side areas"""
+        areas = AreaSet(self.table, self.axis)
+        for x, y, width, height, count, step in self.runs:
+            areas.add(x, y + width, self.table.width - width - 1, height,
+                      count, step)
+        return areas
+
+    @instrumented('AreaSet.group')
+    def group(self, key=None, presorted=False, sort=False):
+        """group each area, see ``Area.group``"""
+        groups = AreaSet(self.table, 'row')
+        for x, y, width, height in list(self.rectangles()):
+            for start, stop in _group_bounds(self.table, x, y, width, height,
+                                             key, presorted, sort):
+                groups.add(x + start, y, width, stop - start)
+        return groups
+
+    @instrumented('AreaSet.merge')
+    def merge(self, style=None):
+        for x, y, width, height in self.rectangles():
+            _merge(self.table, x, y, width, height, style)
+        return self
+
+    @instrumented('AreaSet.summary')
+    def summary(self, label=None, label_span=0, location='bottom',
+                label_style=None, value_style=None, aggregate='sum'):
+        """
+        Summarize each area, see ``Area.summary``. The summary rows are added
+        from the top area to the bottom one, and the areas are moved and grown
+        by them as areas are.
+        """
+        if location != 'bottom':
+            for x, y, width, height in list(self.rectangles()):
+                _summarize(self.table, x, y, width, height, label, label_span,
+                           location, label_style, value_style, aggregate)
+            return
+
+        rectangles = list(self.rectangles())
+        # the bottoms of the areas summarized so far, before the summaries
+        bottoms = []
+        with self.table.batch():
+            for x, y, width, height in sorted(rectangles, key=_bottom):
+                # a summary row moves the areas starting at or below it, and
+                # grows the ones above it, as rows inserted into ``AreaIndex``
+                start = x + bisect.bisect_right(bottoms, x)
+                stop = x + height + len(bottoms)
+                _summarize(self.table, start, y, width, stop - start, label,
+                           label_span, location, label_style, value_style,
+                           aggregate)
+                bottoms.append(x + height)
+
+        moved = []
+        for x, y, width, height in rectangles:
+            start = x + bisect.bisect_right(bottoms, x)
+            stop = x + height + bisect.bisect_right(bottoms, x + height)
+            moved.append((start, y, width, stop - start))
+        self.runs = []
+        for rectangle in moved:
+            self.add(*rectangle)
+
+    @instrumented('AreaSet.set_style')
+    def set_style(self, style):
+        for cell in self.cells():
+            cell.style = style
+
+
+def _bottom(rectangle):
+    return rectangle[0] + rectangle[3]
+
+
+def _merge(table, x, y, width, height, style):
+    cell = table[x][y]
+    if table.changes is not None and (width > 1 or height > 1):
+        table.changes.rows.update(range(x, x + height))
+
+    for row_num in range(height):
+        row = table[x + row_num]
+        for col_num in range(width):
+            if row_num or col_num:
+                row[y + col_num] = None
+    cell.height = height
+    if style is not None:
+        cell.style = style
+    table.areas.add_span(x, height, y, width)
+
+
+def _group_bounds(table, x, y, width, height, key, presorted, sort=False):
+    """the ``(start, stop)`` row ranges of the groups of an area"""
+    if sort:
+        return _sorted_group_bounds(table, x, y, width, height, key, sort)
+    return _adjacent_group_bounds(table, x, y, width, height, key, presorted)
+
+
+def _sorted_group_bounds(table, x, y, width, height, key, sort):
+    table._check_movable(x, x + height)
+    if key is None:
+        columns = [table._column_values(y + col_num, x, x + height)
+                   for col_num in range(width)]
+        keys = columns[0] if width == 1 else list(zip(*columns))
+    else:
+        keys = [key(_row_key(table[x + row_num], y, width))
+                for row_num in range(height)]
+
+    if sort == 'hash':
+        groups = collections.OrderedDict()
+        for row_num, value in enumerate(keys):
+            groups.setdefault(value, []).append(row_num)
+        order = list(itertools.chain.from_iterable(groups.values()))
+        sizes = [len(row_nums) for row_nums in groups.values()]
+    else:
+        order = sorted(range(height), key=lambda row_num: _sort_key(
+            keys[row_num]))
+        sizes = [sum(1 for _ in group) for _, group in
+                 itertools.groupby(order, key=keys.__getitem__)]
+    table._reorder_rows(x, order)
+
+    bounds = []
+    start = 0
+    for size in sizes:
+        bounds.append((start, start + size))
+        start += size
+    return bounds
+
+
+def _sort_key(value):
+    """a key sorting ``None``, which can't be compared on Python 3, first"""
+    if isinstance(value, tuple):
+        return tuple(_sort_key(item) for item in value)
+    return value is not None, value
+
+
+def _row_key(row, y, width):
+    if width == 1:
+        return row[y]
+    return tuple(row[y + col_num] for col_num in range(width))
+
+
+def _adjacent_group_bounds(table, x, y, width, height, key, presorted):
+    def key_at(row_num):
+        cell = _row_key(table[x + row_num], y, width)
+        return cell if key is None else key(cell)
+
+    start_index = 0
+    while start_index < height:
+        start_value = key_at(start_index)
+        if presorted:
+            end_index = _search_group_end(key_at, height, start_index,
+                                          start_value)
+        else:
+            end_index = start_index + 1
+            while end_index < height and key_at(end_index) == start_value:
+                end_index += 1
+        yield start_index, end_index
+        start_index = end_index
+
+
+def _search_group_end(key_at, height, start_index, start_value):
+    # gallop to a row out of the group, then binary search its start
+    low, step = start_index, 1
+    high = min(start_index + step, height)
+    while high < height and key_at(high) == start_value:
+        low, step = high, step * 2
+        high = min(start_index + step, height)
+
+    low += 1
+    while low < high:
+        middle = (low + high) // 2
+        if key_at(middle) == start_value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _summarize(table, x, y, width, height, label, label_span, location,
+               label_style, value_style, aggregate):
+    aggregate = get_aggregate(aggregate)
+    if location == 'bottom':
+        new_row_num = _add_row_at_bottom(table, x, y, height, label_style,
+                                         label, label_span, value_style,
+                                         aggregate)
+
+        _update_existed_areas(table, y, width, new_row_num)
+        table.height += 1
+    elif location == 'right':
+        _add_col_at_right(table, x, y, width, height, label_style, label,
+                          label_span, value_style, aggregate)
+        # todo: update existed areas
+        table.width += 1
+    else:
+        raise NotImplemented
+
+
+def _update_existed_areas(table, self_y, self_width, new_row_num):
+    def is_merged(x, y, width, height):
+        # the cells overwritten or unmerged since no longer span their rows
+        cell = table[x][y]
+        return cell is not None and (cell.height > 1 or height == 1)
+
+    grown = table.areas.insert_row(new_row_num, is_merged)
+    for x, y, width, height in grown:
+        # handle merged cell
+        cell = table[x][y]
+        if cell is not None and cell.width == width \
+                and cell.height == height:
+            # todo
+            if self_y <= y + width - 1 and self_y + self_width - 1 >= y:
+                pass
+            else:
+                cell.height += 1
+
+
+def _add_row_at_bottom(table, x, y, height, label_style, text, label_span,
+                       value_style, aggregate):
+    new_row_num = x + height
+    table._insert_row(new_row_num, [None] * table.width)
+    appended_row = table[new_row_num]
+
+    # add label cell
+    if label_span != 0:
+        appended_row[y] = Cell(text, width=label_span)
+        if label_style is not None:
+            appended_row[y].style = label_style
+        else:
+            appended_row[y].style = table.style
+
+    # add summarized cells
+    # todo: not iterate to table.width
+    totals = table._total_rows
+    total_row_nums = set(totals[bisect.bisect_left(totals, x):
+                                bisect.bisect_left(totals, new_row_num)])
+    row_nums = [row_num for row_num in range(x, new_row_num)
+                if row_num not in total_row_nums]
+    column_values = table._column_reader(row_nums)
+    for col_num in range(y + label_span, table.width):
+        total = aggregate(column_values(col_num))
+        appended_row[col_num] = Cell(total)
+        if value_style is not None:
+            appended_row[col_num].style = value_style
+        else:
+            appended_row[col_num].style = table.style
+    bisect.insort(table._total_rows, new_row_num)
+    return new_row_num
+
+
+def _add_col_at_right(table, x, y, width, height, label_style, text,
+                      label_span, value_style, aggregate):
+    new_col_num = y + width
+    table._insert_column(new_col_num)
+
+    appended_col = Column(table=table, position=(0, new_col_num),
+                          height=height)
+
+    # add label cell
+    if label_span != 0:
+        appended_col[x] = Cell(text, height=label_span)
+        if label_style is not None:
+            appended_col[x].style = label_style
+        else:
+            appended_col[x].style = table.style
+
+    # add summarized cells
+    for row_num in range(x + label_span, x + height):
+        row = table[row_num]
+        total = aggregate([row[col_num].value for col_num in
+                           range(y, y + width)])
+        appended_col[row_num] = Cell(total)
+        if value_style is not None:
+            appended_col[row_num].style = value_style
+        else:
+            appended_col[row_num].style = table.style
+    bisect.insort(table._total_rows, new_col_num)
+    return new_col_num
+
+
 class Row(object):
+    __slots__ = ('table', 'x', 'y', 'width')
+
     def __init__(self, table, position, width):
         self.table = table
         self.x, self.y = position
@@ -420,6 +1236,8 @@ class Row(object):
 
     def __setitem__(self, col, value):
         assert col < self.width
+        if self.table.changes is not None:
+            self.table.changes.rows.add(self.x)
         self.table[self.x][self.y + col] = value
 
     def __iter__(self):
@@ -435,6 +1253,7 @@ class Row(object):
     def __repr__(self):
         return str([self[i] for i in range(self.width)])
 
+    @instrumented('Row.set_style')
     def set_style(self, style):
         for cell in self:
             if cell:
@@ -442,6 +1261,8 @@ class Row(object):
 
 
 class Column(object):
+    __slots__ = ('table', 'x', 'y', 'height')
+
     def __init__(self, table, position, height):
         self.table = table
         self.x, self.y = position
@@ -453,6 +1274,8 @@ class Column(object):
 
     def __setitem__(self, row, value):
         assert row < self.height
+        if self.table.changes is not None:
+            self.table.changes.rows.add(self.x + row)
         self.table[self.x + row][self.y] = value
 
     def __iter__(self):
@@ -468,6 +1291,7 @@ class Column(object):
     def __repr__(self):
         return str([self[i] for i in range(self.height)])
 
+    @instrumented('Column.set_style')
     def set_style(self, style):
         for cell in self:
             if cell:
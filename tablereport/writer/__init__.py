@@ -1 +1,4 @@
+from .delimited import CsvWriter
 from .excel import *
+from .xlsx import XlsxCache, XlsxWriter
+from .width import WidthEstimator, east_asian_width, utf8_width
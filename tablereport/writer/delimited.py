@@ -0,0 +1,81 @@
+"""
+Write tables into delimited text files, such as CSV and TSV.
+"""
+from __future__ import unicode_literals
+
+import csv
+
+import six
+
+from ..instrument import instrumented
+
+
+class CsvWriter(object):
+    # the values of the cells covered by a merged cell are:
+    # - 'repeat': the value of the merged cell
+    # - 'first': empty, only the first cell of the merge holds the value
+    # - 'blank': empty, as is the merged cell itself
+    MERGE_POLICIES = ('repeat', 'first', 'blank')
+
+    @staticmethod
+    @instrumented('CsvWriter.write', target=1)
+    def write(file, table, merged='repeat', chunk_size=1000, dialect='excel',
+              **fmtparams):
+        """
+        Write the rows of a table into a file-like object, ``chunk_size`` rows
+        at a time, with ``csv.writer(file, dialect, **fmtparams)``. Use
+        ``dialect='excel-tab'`` to write TSV.
+
+        The rows are iterated only once, so lazy tables are streamed too. A
+        span of a lazy table growing over the next chunk is only known once
+        its first row was written, so ``'blank'`` leaves that first cell. On
+        Python 2, ``file`` must be opened in binary mode and text is encoded
+        as UTF-8.
+        """
+        if merged not in CsvWriter.MERGE_POLICIES:
+            raise ValueError('unknown merge policy: {}'.format(merged))
+
+        writer = csv.writer(file, dialect, **fmtparams)
+        # (cell, row_num, col_num) of the last cell starting above each column
+        covers = [None] * table.width
+        chunk = []
+        for row_num, row in enumerate(table.iter_rows()):
+            values = []
+            for col_num in range(table.width):
+                cell = row[col_num]
+                if cell is None:
+                    values.append(_covered_value(covers[col_num], row_num,
+                                                 col_num, merged))
+                    continue
+
+                # the span of a cell of a lazy table can still grow, so every
+                # cell may cover the ones below it
+                for covered in range(col_num, col_num + cell.width):
+                    covers[covered] = cell, row_num, col_num
+                if merged == 'blank' and (cell.width > 1 or cell.height > 1):
+                    values.append('')
+                else:
+                    values.append(_text(cell.value))
+
+            chunk.append(values)
+            if len(chunk) == chunk_size:
+                writer.writerows(chunk)
+                chunk = []
+        writer.writerows(chunk)
+
+
+def _covered_value(cover, row_num, col_num, merged):
+    if cover is None or merged != 'repeat':
+        return ''
+    cell, top, left = cover
+    if row_num < top + cell.height and col_num < left + cell.width:
+        return _text(cell.value)
+    return ''
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
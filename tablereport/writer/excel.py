@@ -1,20 +1,196 @@
-import math
+import multiprocessing
+import weakref
 
-import six
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Side, Border, Font, PatternFill
+from openpyxl.styles.cell_style import StyleArray
 from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+
+from ..instrument import instrumented
+from ..tablereport import LazyTable
+from .width import WidthEstimator
+
+# the style keys used by the writer
+_STYLE_KEYS = ('font_weight', 'font_size', 'vertical_align', 'horizontal_align',
+               'background_color')
+
+# workbook -> {values of _STYLE_KEYS: style ids of an excel cell}
+_workbook_style_ids = weakref.WeakKeyDictionary()
+
+
+def _apply_style(excel_cell, style):
+    """
+    Apply a style to an excel cell, and return the ids of the openpyxl styles
+    set on it, as ``((name, id), ...)``
+    """
+    applied = ['borderId']
+
+    font_weight = style.get('font_weight')
+    font_size = style.get('font_size')
+    if font_weight is not None or font_size is not None:
+        font = Font(size=font_size, bold=font_weight == 'blod')
+        excel_cell.font = font
+        applied.append('fontId')
+
+    vertical_align = style.get('vertical_align')
+    horizontal_align = style.get('horizontal_align')
+    if vertical_align is not None or horizontal_align is not None:
+        align = Alignment(horizontal=horizontal_align,
+                          vertical=vertical_align)
+        excel_cell.alignment = align
+        applied.append('alignmentId')
+
+    background_color = style.get('background_color')
+    if background_color is not None:
+        fill = PatternFill(start_color=background_color,
+                           end_color=background_color,
+                           fill_type='darkDown')
+        excel_cell.fill = fill
+        applied.append('fillId')
+
+    side = Side(border_style='thin', color="fff0f0f0")
+    border = Border(
+        left=excel_cell.border.left,
+        right=excel_cell.border.right,
+        top=excel_cell.border.top,
+        bottom=excel_cell.border.bottom
+    )
+    border.left = side
+    border.right = side
+    border.top = side
+    border.bottom = side
+    excel_cell.border = border
+
+    return tuple((name, getattr(excel_cell._style, name)) for name in applied)
+
+
+def _style_key(style):
+    return tuple(style.get(name) for name in _STYLE_KEYS)
+
+
+def _set_style_ids(excel_cell, style_ids):
+    style_array = excel_cell._style
+    if style_array is None:
+        excel_cell._style = style_array = StyleArray()
+    for name, style_id in style_ids:
+        setattr(style_array, name, style_id)
+
+
+class _StyleCache(object):
+    """
+    Each distinct style is only converted into openpyxl styles once per
+    workbook, then its style ids are copied to the other cells.
+    """
+
+    def __init__(self, workbook):
+        self._workbook_style_ids = _workbook_style_ids.setdefault(workbook, {})
+        self._style_ids = {}
+
+    def apply(self, excel_cell, style):
+        style_ids = self._style_ids.get(id(style))
+        if style_ids is None:
+            self._style_ids[id(style)] = self.apply_key(excel_cell,
+                                                        _style_key(style))
+        else:
+            _set_style_ids(excel_cell, style_ids)
+
+    def apply_key(self, excel_cell, key):
+        """apply a style given by its ``_style_key``, return its style ids"""
+        style_ids = self._workbook_style_ids.get(key)
+        if style_ids is None:
+            style_ids = _apply_style(excel_cell, dict(zip(_STYLE_KEYS, key)))
+            self._workbook_style_ids[key] = style_ids
+        else:
+            _set_style_ids(excel_cell, style_ids)
+        return style_ids
+
+
+class _Merges(object):
+    """
+    Merge the cells spanning several rows or columns.
+
+    The span of a cell of a lazy table may still grow with the rows which
+    have not been read yet, so the cell is only merged once another cell
+    starts in its column, or at the end. The cells of a table are merged
+    right away.
+    """
+
+    def __init__(self, table, merge):
+        self._merge = merge
+        self._deferred = isinstance(table, LazyTable)
+        self._pending = {}
+
+    def add(self, col_num, excel_x, excel_y, cell):
+        if self._deferred:
+            pending = self._pending.pop(col_num, None)
+            if pending is not None:
+                self._add(*pending)
+            self._pending[col_num] = excel_x, excel_y, cell
+        else:
+            self._add(excel_x, excel_y, cell)
+
+    def flush(self):
+        for col_num in sorted(self._pending):
+            self._add(*self._pending[col_num])
+        self._pending.clear()
+
+    def _add(self, excel_x, excel_y, cell):
+        if any([cell.height > 1, cell.width > 1]):
+            self._merge(CellRange(min_row=excel_x,
+                                  max_row=excel_x + cell.height - 1,
+                                  min_col=excel_y,
+                                  max_col=excel_y + cell.width - 1))
+
+
+class PreparedSheet(object):
+    """
+    The values and style keys of the cells of a table, its merged ranges and
+    the dimensions of its rows and columns, ready to be written at
+    ``position``. ``rows`` holds a ``(value, style key)`` per cell, or
+    ``None`` for the cells covered by a merged one.
+    """
+
+    def __init__(self, position):
+        self.position = position
+        self.rows = []
+        self.merges = []
+        self.row_height = []
+        self.col_width = []
 
 
 class WorkSheetWriter(object):
     @staticmethod
-    def write(worksheet, table, position):
-        row_height = [None] * table.height
-        col_width = [None] * table.width
+    @instrumented('WorkSheetWriter.write', target=1)
+    def write(worksheet, table, position, estimator=None):
+        """
+        Write a table into a worksheet at ``position``.
+
+        If the worksheet is the (empty) write-only worksheet of a workbook
+        created with ``Workbook(write_only=True)``, the rows are streamed into
+        it one by one instead of being kept in memory.
+
+        The automatic widths and heights are measured by ``estimator``, a
+        ``WidthEstimator``, which can be shared by several worksheets.
+        """
+        if estimator is None:
+            estimator = WidthEstimator()
+        if isinstance(worksheet, WriteOnlyWorksheet):
+            WorkSheetWriter._write_rows(worksheet, table, position, estimator)
+            return
+
         x, y = position[0] + 1, position[1] + 1
+        styles = _StyleCache(worksheet.parent)
+        merges = _Merges(table, lambda cell_range: worksheet.merge_cells(
+            cell_range.coord))
 
-        for row_num in range(table.height):
+        row_height = []
+        col_width = [None] * table.width
+        for row_num, row in enumerate(table.iter_rows()):
+            row_height.append(estimator.measure_row(row, row_num, col_width))
             for col_num in range(table.width):
-                cell = table[row_num][col_num]
+                cell = row[col_num]
 
                 if cell is None:
                     continue
@@ -22,12 +198,7 @@ class WorkSheetWriter(object):
                 excel_x = x + row_num
                 excel_y = y + col_num
 
-                if any([cell.height > 1, cell.width > 1]):
-                    worksheet.merge_cells(
-                        start_row=excel_x,
-                        end_row=excel_x + cell.height - 1,
-                        start_column=excel_y,
-                        end_column=excel_y + cell.width - 1)
+                merges.add(col_num, excel_x, excel_y, cell)
 
                 excel_cell = worksheet.cell(row=excel_x, column=excel_y,
                                             value=cell.value)
@@ -35,65 +206,222 @@ class WorkSheetWriter(object):
                 if cell.style is None:
                     continue
 
-                font_weight = cell.style.get('font_weight')
-                font_size = cell.style.get('font_size')
-                if font_weight is not None or font_size is not None:
-                    font = Font(size=font_size, bold=font_weight == 'blod')
-                    excel_cell.font = font
-
-                vertical_align = cell.style.get('vertical_align')
-                horizontal_align = cell.style.get('horizontal_align')
-                if vertical_align is not None or horizontal_align is not None:
-                    align = Alignment(horizontal=horizontal_align,
-                                      vertical=vertical_align)
-                    excel_cell.alignment = align
-
-                background_color = cell.style.get('background_color')
-                if background_color is not None:
-                    fill = PatternFill(start_color=background_color,
-                                       end_color=background_color,
-                                       fill_type='darkDown')
-                    excel_cell.fill = fill
-
-                side = Side(border_style='thin', color="fff0f0f0")
-                border = Border(
-                    left=excel_cell.border.left,
-                    right=excel_cell.border.right,
-                    top=excel_cell.border.top,
-                    bottom=excel_cell.border.bottom
-                )
-                border.left = side
-                border.right = side
-                border.top = side
-                border.bottom = side
-                excel_cell.border = border
-
-                if all([cell.height == 1, cell.width == 1]):
-                    font_size = font_size or 11
-                    width = cell.style.get('width')
-                    if width is not None:
-                        if width == 'auto':
-                            width = (len(
-                                six.text_type(cell.value).encode('utf-8'))
-                                     + len(six.text_type(cell.value))
-                                     ) / 2 * math.ceil(font_size / 11.0)
-                        col_width[col_num] = max(width, col_width[col_num],
-                                                 key=lambda v: v or 0)
-
-                    height = cell.style.get('height')
-                    if height is not None:
-                        if height == 'auto':
-                            height = math.ceil(font_size * 1.5)
-                        row_height[row_num] = max(height, row_height[row_num],
-                                                  key=lambda v: v or 0)
+                styles.apply(excel_cell, cell.style)
+        merges.flush()
+
+        WorkSheetWriter._write_dimensions(worksheet, position, row_height,
+                                          col_width)
+
+    @staticmethod
+    def _write_rows(worksheet, table, position, estimator):
+        x, y = position[0] + 1, position[1] + 1
+        styles = _StyleCache(worksheet.parent)
+        merges = _Merges(table, worksheet.merged_cells.add)
+
+        # the column widths are written before the first row, so they are only
+        # measured on the first chunk of a lazy table
+        col_width = [None] * table.width
+        head = table.head() if isinstance(table, LazyTable) \
+            else table.iter_rows()
+        for row_num, row in enumerate(head):
+            estimator.measure_row(row, row_num, col_width)
+        WorkSheetWriter._write_dimensions(worksheet, position, [], col_width)
+
+        for _ in range(position[0]):
+            worksheet.append([])
+
+        for row_num, row in enumerate(table.iter_rows()):
+            row_height = estimator.measure_row(row, row_num, col_width)
+            if row_height is not None:
+                worksheet.row_dimensions[x + row_num].height = row_height
+
+            excel_row = [None] * position[1]
+            for col_num in range(table.width):
+                cell = row[col_num]
+
+                if cell is None:
+                    excel_row.append(None)
+                    continue
+
+                merges.add(col_num, x + row_num, y + col_num, cell)
+
+                excel_cell = WriteOnlyCell(worksheet, value=cell.value)
+                if cell.style is not None:
+                    styles.apply(excel_cell, cell.style)
+                excel_row.append(excel_cell)
+            worksheet.append(excel_row)
+        merges.flush()
+
+    @staticmethod
+    def prepare(table, position, estimator=None):
+        """
+        Prepare the cells of a table for ``write_prepared``, as a
+        ``PreparedSheet`` which, unlike tables, can be sent to other processes.
+        """
+        if estimator is None:
+            estimator = WidthEstimator()
+        prepared = PreparedSheet(position)
+        x, y = position[0] + 1, position[1] + 1
+        merges = _Merges(table, lambda cell_range: prepared.merges.append(
+            cell_range.coord))
+
+        style_keys = {}
+        col_width = [None] * table.width
+        for row_num, row in enumerate(table.iter_rows()):
+            prepared.row_height.append(
+                estimator.measure_row(row, row_num, col_width))
+            items = []
+            for col_num in range(table.width):
+                cell = row[col_num]
+
+                if cell is None:
+                    items.append(None)
+                    continue
+
+                merges.add(col_num, x + row_num, y + col_num, cell)
+
+                style = cell.style
+                if style is None:
+                    key = None
                 else:
-                    height = cell.style.get('height')
-                    if height is not None:
-                        if height == 'auto':
-                            height = math.ceil(font_size * 1.5)
-                        row_height[row_num] = max(height, row_height[row_num],
-                                                  key=lambda v: v or 0)
+                    key = style_keys.get(id(style))
+                    if key is None:
+                        key = style_keys[id(style)] = _style_key(style)
+                items.append((cell.value, key))
+            prepared.rows.append(items)
+        merges.flush()
+        prepared.col_width = col_width
 
+        return prepared
+
+    @staticmethod
+    def write_prepared(worksheet, prepared):
+        """write a ``PreparedSheet`` into a worksheet"""
+        position = prepared.position
+        x, y = position[0] + 1, position[1] + 1
+        styles = _StyleCache(worksheet.parent)
+
+        if isinstance(worksheet, WriteOnlyWorksheet):
+            WorkSheetWriter._write_dimensions(worksheet, position, [],
+                                              prepared.col_width)
+            for _ in range(position[0]):
+                worksheet.append([])
+
+            for row_num, items in enumerate(prepared.rows):
+                row_height = prepared.row_height[row_num]
+                if row_height is not None:
+                    worksheet.row_dimensions[x + row_num].height = row_height
+
+                excel_row = [None] * position[1]
+                for item in items:
+                    if item is None:
+                        excel_row.append(None)
+                        continue
+
+                    value, key = item
+                    excel_cell = WriteOnlyCell(worksheet, value=value)
+                    if key is not None:
+                        styles.apply_key(excel_cell, key)
+                    excel_row.append(excel_cell)
+                worksheet.append(excel_row)
+
+            for coord in prepared.merges:
+                worksheet.merged_cells.add(CellRange(coord))
+            return
+
+        for coord in prepared.merges:
+            worksheet.merge_cells(coord)
+
+        for row_num, items in enumerate(prepared.rows):
+            for col_num, item in enumerate(items):
+                if item is None:
+                    continue
+
+                value, key = item
+                excel_cell = worksheet.cell(row=x + row_num, column=y + col_num,
+                                            value=value)
+                if key is not None:
+                    styles.apply_key(excel_cell, key)
+
+        WorkSheetWriter._write_dimensions(worksheet, position,
+                                          prepared.row_height,
+                                          prepared.col_width)
+
+    @staticmethod
+    @instrumented('WorkSheetWriter.patch', target=1)
+    def patch(worksheet, table, position, estimator=None):
+        """
+        Rewrite the rows of a worksheet which changed since the table was
+        last written into it at ``position``, as tracked by
+        ``Table.track_changes``, then clear the changes.
+
+        The merged ranges crossing the changed rows are rewritten as a whole.
+        The columns are widened to fit the changed cells, but not narrowed.
+        """
+        if estimator is None:
+            estimator = WidthEstimator()
+        x, y = position[0] + 1, position[1] + 1
+        changes = table.changes
+        row_nums = set(changes.dirty_rows(table))
+        data = table.data
+
+        for cell_range in list(worksheet.merged_cells.ranges):
+            rows = range(cell_range.min_row - x, cell_range.max_row - x + 1)
+            if cell_range.min_col >= y and \
+                    cell_range.max_col < y + table.width and \
+                    not row_nums.isdisjoint(rows):
+                worksheet.unmerge_cells(cell_range.coord)
+                row_nums.update(row_num for row_num in rows
+                                if row_num < table.height)
+
+        # the rows covered by the merged cells of the changed rows
+        pending = list(row_nums)
+        while pending:
+            row_num = pending.pop()
+            for cell in data[row_num]:
+                if cell is None or cell.height == 1:
+                    continue
+                for covered in range(row_num + 1,
+                                     min(row_num + cell.height, table.height)):
+                    if covered not in row_nums:
+                        row_nums.add(covered)
+                        pending.append(covered)
+        row_nums = sorted(row_nums)
+
+        styles = _StyleCache(worksheet.parent)
+        merges = _Merges(table, lambda cell_range: worksheet.merge_cells(
+            cell_range.coord))
+        col_width = [None] * table.width
+        for col_num in range(table.width):
+            column_letter = get_column_letter(y + col_num)
+            if column_letter in worksheet.column_dimensions:
+                col_width[col_num] = \
+                    worksheet.column_dimensions[column_letter].width
+
+        for row_num in row_nums:
+            row = data[row_num]
+            worksheet.row_dimensions[x + row_num].height = \
+                estimator.measure_row(row, row_num, col_width)
+            for col_num in range(table.width):
+                cell = row[col_num]
+                if cell is None:
+                    continue
+
+                merges.add(col_num, x + row_num, y + col_num, cell)
+
+                excel_cell = worksheet.cell(row=x + row_num,
+                                            column=y + col_num)
+                excel_cell.value = cell.value
+                excel_cell._style = StyleArray()
+                if cell.style is not None:
+                    styles.apply(excel_cell, cell.style)
+        merges.flush()
+
+        WorkSheetWriter._write_dimensions(worksheet, position, [], col_width)
+        changes.clear(table, row_nums)
+
+    @staticmethod
+    def _write_dimensions(worksheet, position, row_height, col_width):
         for i, value in enumerate(row_height):
             if value is None:
                 pass
@@ -105,3 +433,50 @@ class WorkSheetWriter(object):
             else:
                 column_letter = get_column_letter(position[1] + i + 1)
                 worksheet.column_dimensions[column_letter].width = value
+
+
+def _prepare(job):
+    build, position, estimator = job
+    return WorkSheetWriter.prepare(build(), position, estimator)
+
+
+class WorkbookWriter(object):
+    @staticmethod
+    def write(workbook, sheets, processes=None, estimator=None):
+        """
+        Write tables into new worksheets of a workbook.
+
+        ``sheets`` is a list of ``(title, table, position)``. Instead of a
+        table, a function building it can be given: such functions must be
+        picklable (module level functions, or ``functools.partial`` of them),
+        and the tables are built and prepared in a pool of ``processes``
+        processes, by default as many as CPUs. Only the final assembly of the
+        worksheets is serial. Tables themselves cannot be sent to other
+        processes, so they are written by the current one.
+        """
+        jobs = [(table, position, estimator)
+                for _, table, position in sheets if callable(table)]
+        pool = None
+        if processes == 1 or len(jobs) < 2:
+            prepared = (_prepare(job) for job in jobs)
+        else:
+            pool = multiprocessing.Pool(processes)
+            prepared = pool.imap(_prepare, jobs)
+
+        try:
+            for title, table, position in sheets:
+                worksheet = workbook.create_sheet(title)
+                if callable(table):
+                    WorkSheetWriter.write_prepared(worksheet, next(prepared))
+                else:
+                    WorkSheetWriter.write(worksheet, table, position,
+                                          estimator)
+        except BaseException:
+            # the tables still being prepared are not needed anymore
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            raise
+        if pool is not None:
+            pool.close()
+            pool.join()
@@ -0,0 +1,107 @@
+"""
+Estimation of the widths of columns and the heights of rows, for the styles
+whose ``width`` or ``height`` is ``'auto'``.
+"""
+import math
+import unicodedata
+
+import six
+
+from ..style import Style
+
+# the number of distinct values whose widths are kept by an estimator
+CACHE_SIZE = 100000
+
+
+def utf8_width(text):
+    """
+    The width of a text, as the mean of its number of characters and of
+    UTF-8 bytes: 1 for ASCII characters and 2 for CJK ones.
+    """
+    return (len(text.encode('utf-8')) + len(text)) / 2
+
+
+def east_asian_width(text):
+    """
+    The width of a text, as the number of columns of a terminal: 2 for wide
+    and fullwidth characters, 0 for combining ones and 1 for the others.
+    """
+    width = 0
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in 'WF' else 1
+    return width
+
+
+class WidthEstimator(object):
+    """
+    Measure the cells written by the writers.
+
+    ``estimate(text)`` gives the width of the text of a value at the default
+    font size, and is called once per distinct value. With ``sample=N``, the
+    widths of the columns are only measured on their first N rows.
+    """
+    __slots__ = ('estimate', 'sample', '_widths', '_styles')
+
+    def __init__(self, estimate=utf8_width, sample=None):
+        self.estimate = estimate
+        self.sample = sample
+        self._widths = {}
+        # id of a ``Style`` -> the style, its font size, width and height.
+        # Styles never change, unlike the dicts also used as styles.
+        self._styles = {}
+
+    def text_width(self, value):
+        # 1, 1.0 and True are equal, but their texts are not
+        key = value if isinstance(value, six.text_type) \
+            else (value.__class__, value)
+        try:
+            return self._widths[key]
+        except KeyError:
+            width = self.estimate(six.text_type(value))
+            if len(self._widths) < CACHE_SIZE:
+                self._widths[key] = width
+            return width
+        except TypeError:
+            return self.estimate(six.text_type(value))
+
+    def measure_row(self, row, row_num, col_width):
+        """
+        Compute the height of a row, and widen ``col_width`` to the widths of
+        its cells, unless the row is not sampled.
+        """
+        sampled = self.sample is None or row_num < self.sample
+        row_height = None
+        for col_num, cell in enumerate(row):
+            if cell is None:
+                continue
+            style = cell.style
+            if style is None:
+                continue
+
+            try:
+                _, font_size, style_width, height = self._styles[id(style)]
+            except KeyError:
+                attributes = _, font_size, style_width, height = (
+                    style, style.get('font_size'), style.get('width'),
+                    style.get('height'))
+                if isinstance(style, Style):
+                    self._styles[id(style)] = attributes
+            if cell.height == 1 and cell.width == 1:
+                font_size = font_size or 11
+                width = style_width if sampled else None
+                if width is not None:
+                    if width == 'auto':
+                        width = self.text_width(cell.value) * \
+                            math.ceil(font_size / 11.0)
+                    if width >= (col_width[col_num] or 0):
+                        col_width[col_num] = width
+
+            if height is not None:
+                if height == 'auto':
+                    height = math.ceil(font_size * 1.5)
+                if height >= (row_height or 0):
+                    row_height = height
+
+        return row_height
@@ -0,0 +1,554 @@
+"""
+Write tables straight into xlsx files, without going through the cell objects
+of openpyxl.
+"""
+from __future__ import unicode_literals
+
+import decimal
+import itertools
+import zipfile
+import zlib
+from xml.sax.saxutils import escape, quoteattr
+
+import six
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE, TIME_FORMATS
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
+from openpyxl.utils.exceptions import IllegalCharacterError
+from openpyxl.writer.theme import theme_xml
+
+from .excel import _STYLE_KEYS, _Merges, _style_key
+from .width import WidthEstimator
+from ..instrument import instrumented
+from ..tablereport import LazyTable
+
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+           'relationships')
+_PACKAGE_REL_NS = ('http://schemas.openxmlformats.org/package/2006/'
+                   'relationships')
+_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.'
+
+_NUMBER_TYPES = six.integer_types + (float, decimal.Decimal)
+
+# the rows of a sheet are compressed by batches of this size
+_ROWS_PER_WRITE = 500
+
+# the minimum number of bytes written into the archive at a time
+_WRITE_SIZE = 1 << 16
+
+_DEFAULT_FONT = ('<font><name val="Calibri"/><family val="2"/>'
+                 '<color theme="1"/><sz val="11"/><scheme val="minor"/>'
+                 '</font>')
+_DEFAULT_FILLS = ['<fill><patternFill/></fill>',
+                  '<fill><patternFill patternType="gray125"/></fill>']
+_DEFAULT_BORDER = ('<border><left/><right/><top/><bottom/><diagonal/>'
+                   '</border>')
+_THIN_BORDER = ('<border>{0}</border>'.format(''.join(
+    '<{0} style="thin"><color rgb="fff0f0f0"/></{0}>'.format(side)
+    for side in ('left', 'right', 'top', 'bottom'))))
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value.is_integer():
+            return '%d' % value
+        return repr(value)
+    return six.text_type(value)
+
+
+def _color(color):
+    # as openpyxl does, colors without alpha are given a transparent one
+    if len(color) == 6:
+        color = '00' + color
+    return color
+
+
+class _SharedStrings(object):
+    def __init__(self):
+        self._indexes = {}
+        self._strings = []
+        self.count = 0
+
+    def index(self, string):
+        self.count += 1
+        index = self._indexes.get(string)
+        if index is None:
+            if ILLEGAL_CHARACTERS_RE.search(string):
+                raise IllegalCharacterError(
+                    '{!r} cannot be used in worksheets.'.format(string))
+            index = self._indexes[string] = len(self._strings)
+            self._strings.append(string)
+        return index
+
+    def xml(self):
+        yield ('<sst xmlns="{}" count="{}" uniqueCount="{}">'
+               .format(_MAIN_NS, self.count, len(self._strings)))
+        for string in self._strings:
+            if string != string.strip():
+                yield '<si><t xml:space="preserve">{}</t></si>'.format(
+                    escape(string))
+            else:
+                yield '<si><t>{}</t></si>'.format(escape(string))
+        yield '</sst>'
+
+
+class _Styles(object):
+    """
+    The ``styles.xml`` of a workbook, with the same fonts, fills, borders and
+    alignments as the ones set by ``WorkSheetWriter``. Each distinct
+    ``(style, number format)`` is converted into a cell format once.
+    """
+
+    def __init__(self):
+        self._fonts = _Index([_DEFAULT_FONT])
+        self._fills = _Index(_DEFAULT_FILLS)
+        self._borders = _Index([_DEFAULT_BORDER, _THIN_BORDER])
+        self._number_formats = _Index([], start=164)
+        self._formats = _Index(['<xf numFmtId="0" fontId="0" fillId="0" '
+                                'borderId="0" xfId="0"/>'])
+        # (id of the style, number format) -> (style, attribute), the style
+        # being kept so that its id is not reused by another style
+        self._ids = {}
+
+    def attribute(self, style, number_format=None):
+        """the ``s`` attribute of the cells with a style and number format"""
+        key = id(style), number_format
+        entry = self._ids.get(key)
+        if entry is None:
+            index = self._format(None if style is None else _style_key(style),
+                                 number_format)
+            entry = self._ids[key] = (
+                style, ' s="{}"'.format(index) if index else '')
+        return entry[1]
+
+    def _format(self, key, number_format):
+        number_format_id = 0
+        if number_format is not None:
+            number_format_id = self._number_formats.add(number_format)
+        if key is None:
+            if not number_format_id:
+                return 0
+            return self._formats.add(
+                '<xf numFmtId="{}" fontId="0" fillId="0" borderId="0" '
+                'xfId="0"/>'.format(number_format_id))
+
+        style = dict(zip(_STYLE_KEYS, key))
+        font_id = fill_id = 0
+
+        if style['font_weight'] is not None or style['font_size'] is not None:
+            font = '<font>'
+            if style['font_weight'] == 'blod':
+                font += '<b val="1"/>'
+            if style['font_size'] is not None:
+                font += '<sz val="{}"/>'.format(_number(style['font_size']))
+            font_id = self._fonts.add(font + '</font>')
+
+        alignment = ''
+        if style['vertical_align'] is not None or \
+                style['horizontal_align'] is not None:
+            alignment = '<alignment'
+            if style['horizontal_align'] is not None:
+                alignment += ' horizontal={}'.format(
+                    quoteattr(style['horizontal_align']))
+            if style['vertical_align'] is not None:
+                alignment += ' vertical={}'.format(
+                    quoteattr(style['vertical_align']))
+            alignment += '/>'
+
+        if style['background_color'] is not None:
+            color = quoteattr(_color(style['background_color']))
+            fill_id = self._fills.add(
+                '<fill><patternFill patternType="darkDown"><fgColor rgb={0}/>'
+                '<bgColor rgb={0}/></patternFill></fill>'.format(color))
+
+        xf = ('<xf numFmtId="{}" fontId="{}" fillId="{}" borderId="1" '
+              'xfId="0"'.format(number_format_id, font_id, fill_id))
+        if alignment:
+            xf += ' applyAlignment="1">{}</xf>'.format(alignment)
+        else:
+            xf += '/>'
+        return self._formats.add(xf)
+
+    def xml(self):
+        yield '<styleSheet xmlns="{}">'.format(_MAIN_NS)
+        if self._number_formats:
+            yield '<numFmts count="{}">'.format(len(self._number_formats))
+            for number_format_id, number_format in \
+                    self._number_formats.items():
+                yield '<numFmt numFmtId="{}" formatCode={}/>'.format(
+                    number_format_id, quoteattr(number_format))
+            yield '</numFmts>'
+        for name, items in (('fonts', self._fonts), ('fills', self._fills),
+                            ('borders', self._borders)):
+            yield '<{} count="{}">'.format(name, len(items))
+            for _, item in items.items():
+                yield item
+            yield '</{}>'.format(name)
+        yield ('<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" '
+               'fillId="0" borderId="0"/></cellStyleXfs>')
+        yield '<cellXfs count="{}">'.format(len(self._formats))
+        for _, xf in self._formats.items():
+            yield xf
+        yield '</cellXfs>'
+        yield ('<cellStyles count="1"><cellStyle name="Normal" xfId="0" '
+               'builtinId="0"/></cellStyles>')
+        yield '</styleSheet>'
+
+
+class _Index(object):
+    """distinct items, numbered from ``start`` in insertion order"""
+
+    def __init__(self, items, start=0):
+        self.start = start
+        self._items = list(items)
+        self._ids = dict((item, start + i) for i, item in enumerate(items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        item_id = self._ids.get(item)
+        if item_id is None:
+            item_id = self._ids[item] = self.start + len(self._items)
+            self._items.append(item)
+        return item_id
+
+    def items(self):
+        return enumerate(self._items, self.start)
+
+
+class XlsxCache(object):
+    """
+    The SpreadsheetML generated for the worksheets of a workbook, for the next
+    ``XlsxWriter`` writing the same tables::
+
+        cache = XlsxCache()
+        with XlsxWriter('report.xlsx', cache) as writer:
+            writer.add_sheet(table, title='Sales')
+        table[3][2].value = 42
+        with XlsxWriter('report.xlsx', cache) as writer:
+            writer.add_sheet(table, title='Sales')
+
+    The changes of the tables are tracked from their first export (see
+    ``Table.track_changes``), and the next exports only generate the blocks
+    of rows holding changed rows again, the other ones being copied from the
+    cache. The cached worksheets are stored uncompressed in the files, so
+    that the copied blocks are not compressed again. Strings and styles are
+    only ever added to the cache, so that they keep their indexes in the
+    cached rows.
+    """
+
+    def __init__(self):
+        self.strings = _SharedStrings()
+        self.styles = _Styles()
+        # title -> _CachedSheet
+        self.sheets = {}
+
+
+class _CachedSheet(object):
+    __slots__ = ('table', 'position', 'col_width', 'blocks')
+
+    def __init__(self, table, position):
+        self.table = table
+        self.position = position
+        self.col_width = []
+        # (rows compressed at the fastest level, merged ranges) per block of
+        # _ROWS_PER_WRITE rows
+        self.blocks = []
+
+
+class XlsxWriter(object):
+    """
+    Write tables into the worksheets of a new xlsx file, by generating the
+    SpreadsheetML of the sheets from their cells::
+
+        with XlsxWriter('report.xlsx') as writer:
+            writer.add_sheet(table, title='Sales')
+
+    The worksheets look the same as the ones written by ``WorkSheetWriter``,
+    but are written several times faster and are streamed into the file, so
+    a lazy table is never entirely in memory. As with write-only worksheets,
+    the column widths of a lazy table are measured on its first chunk.
+
+    Given an ``XlsxCache``, the rows of the tables which did not change since
+    the last writer using it are neither generated nor compressed again.
+    """
+
+    def __init__(self, file, cache=None):
+        self._archive = zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED,
+                                        allowZip64=True)
+        if cache is None:
+            self._strings = _SharedStrings()
+            self._styles = _Styles()
+        else:
+            self._strings = cache.strings
+            self._styles = cache.styles
+        self._cache = cache
+        self._titles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._archive.close()
+
+    @instrumented('XlsxWriter.add_sheet', target=1)
+    def add_sheet(self, table, title=None, position=(0, 0), estimator=None):
+        if title is None:
+            title = 'Sheet{}'.format(len(self._titles) + 1) \
+                if self._titles else 'Sheet'
+        if estimator is None:
+            estimator = WidthEstimator()
+        sheet = None
+        if self._cache is not None and not isinstance(table, LazyTable):
+            sheet = self._cache.sheets.get(title)
+            if sheet is None or sheet.table is not table \
+                    or sheet.position != position:
+                sheet = self._cache.sheets[title] = _CachedSheet(table,
+                                                                 position)
+        self._titles.append(title)
+        self._write_part('xl/worksheets/sheet{}.xml'.format(len(self._titles)),
+                         self._sheet_xml(table, position, estimator, sheet),
+                         zipfile.ZIP_DEFLATED if sheet is None
+                         else zipfile.ZIP_STORED)
+
+    def close(self):
+        sheet_names = ['sheet{}.xml'.format(i + 1)
+                       for i in range(len(self._titles))]
+        self._write_part('xl/sharedStrings.xml', self._strings.xml())
+        self._write_part('xl/styles.xml', self._styles.xml())
+        self._write_part('xl/theme/theme1.xml', [theme_xml])
+
+        self._write_part('xl/workbook.xml', [
+            '<workbook xmlns="{}" xmlns:r="{}"><bookViews><workbookView/>'
+            '</bookViews><sheets>'.format(_MAIN_NS, _REL_NS),
+            ''.join('<sheet name={} sheetId="{}" r:id="rId{}"/>'.format(
+                quoteattr(title), i + 1, i + 1)
+                for i, title in enumerate(self._titles)),
+            '</sheets><calcPr calcId="124519" fullCalcOnLoad="1"/>'
+            '</workbook>'])
+
+        relationships = [('worksheet', 'worksheets/' + name)
+                         for name in sheet_names]
+        relationships += [('sharedStrings', 'sharedStrings.xml'),
+                          ('styles', 'styles.xml'),
+                          ('theme', 'theme/theme1.xml')]
+        self._write_part('xl/_rels/workbook.xml.rels', [
+            '<Relationships xmlns="{}">'.format(_PACKAGE_REL_NS),
+            ''.join('<Relationship Id="rId{}" Type="{}/{}" Target="{}"/>'
+                    .format(i + 1, _REL_NS, kind, target)
+                    for i, (kind, target) in enumerate(relationships)),
+            '</Relationships>'])
+        self._write_part('_rels/.rels', [
+            '<Relationships xmlns="{}"><Relationship Id="rId1" '
+            'Type="{}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'.format(_PACKAGE_REL_NS, _REL_NS)])
+
+        parts = [('/xl/workbook.xml', 'spreadsheetml.sheet.main+xml'),
+                 ('/xl/sharedStrings.xml', 'spreadsheetml.sharedStrings+xml'),
+                 ('/xl/styles.xml', 'spreadsheetml.styles+xml'),
+                 ('/xl/theme/theme1.xml', 'theme+xml')]
+        parts += [('/xl/worksheets/' + name, 'spreadsheetml.worksheet+xml')
+                  for name in sheet_names]
+        self._write_part('[Content_Types].xml', [
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+            'content-types"><Default Extension="rels" ContentType="'
+            'application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>',
+            ''.join('<Override PartName="{}" ContentType="{}{}"/>'.format(
+                name, _CONTENT_TYPE, content_type)
+                for name, content_type in parts),
+            '</Types>'])
+        self._archive.close()
+
+    def _write_part(self, name, chunks, compress_type=zipfile.ZIP_DEFLATED):
+        # a fixed date keeps the files written from the same tables identical
+        info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = compress_type
+        chunks = (chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+                  for chunk in chunks)
+        if six.PY2:
+            self._archive.writestr(info, b''.join(chunks))
+            return
+        with self._archive.open(info, 'w', force_zip64=True) as part:
+            # each write of the archive has a cost, so small chunks, such as
+            # the shared strings, are joined first
+            buffered, size = [], 0
+            for chunk in chunks:
+                buffered.append(chunk)
+                size += len(chunk)
+                if size >= _WRITE_SIZE:
+                    part.write(b''.join(buffered))
+                    buffered, size = [], 0
+            part.write(b''.join(buffered))
+
+    def _sheet_xml(self, table, position, estimator, sheet=None):
+        x, y = position[0] + 1, position[1] + 1
+        letters = [get_column_letter(y + col_num)
+                   for col_num in range(table.width)]
+        merges = []
+        merged = _Merges(table, lambda cell_range: merges.append(
+            cell_range.coord))
+
+        # the column widths are written before the rows
+        lazy = isinstance(table, LazyTable)
+        table_rows = None if lazy else table.data
+        reused = sheet is not None and sheet.blocks \
+            and table.changes is not None \
+            and len(sheet.col_width) == table.width
+        row_height = []
+        if reused:
+            dirty = table.changes.dirty_rows(table)
+            dirty_blocks = set(row_num // _ROWS_PER_WRITE for row_num in dirty)
+            col_width = list(sheet.col_width)
+            for row_num in dirty:
+                estimator.measure_row(table_rows[row_num], row_num,
+                                      col_width)
+        else:
+            col_width = [None] * table.width
+            for row_num, row in enumerate(table.head() if lazy
+                                          else table.iter_rows()):
+                row_height.append(estimator.measure_row(row, row_num,
+                                                        col_width))
+
+        yield '<worksheet xmlns="{}" xmlns:r="{}">'.format(_MAIN_NS, _REL_NS)
+        if not lazy and table.height and table.width:
+            yield '<dimension ref="{}{}:{}{}"/>'.format(
+                letters[0], x, letters[-1], x + table.height - 1)
+        yield ('<sheetViews><sheetView workbookViewId="0"/></sheetViews>'
+               '<sheetFormatPr baseColWidth="8" defaultRowHeight="15"/>')
+        if any(width is not None for width in col_width):
+            yield '<cols>'
+            for col_num, width in enumerate(col_width):
+                if width is not None:
+                    yield ('<col min="{0}" max="{0}" width="{1}" '
+                           'customWidth="1"/>'.format(y + col_num,
+                                                      _number(width)))
+            yield '</cols>'
+
+        yield '<sheetData>'
+        if lazy:
+            blocks = itertools.groupby(
+                enumerate(table.iter_rows()),
+                lambda item: item[0] // _ROWS_PER_WRITE)
+        else:
+            def block_rows(index):
+                # the rows of the blocks which are reused are never read
+                start = index * _ROWS_PER_WRITE
+                stop = min(start + _ROWS_PER_WRITE, table.height)
+                return ((row_num, table_rows[row_num])
+                        for row_num in range(start, stop))
+
+            blocks = ((index, block_rows(index)) for index in range(
+                -(-table.height // _ROWS_PER_WRITE)))
+        cached_blocks = []
+        for index, rows in blocks:
+            if reused and index not in dirty_blocks \
+                    and index < len(sheet.blocks):
+                compressed, block_merges = sheet.blocks[index]
+                merges.extend(block_merges)
+                cached_blocks.append(sheet.blocks[index])
+                yield zlib.decompress(compressed)
+                continue
+
+            first_merge = len(merges)
+            data = ''.join(self._rows_xml(rows, x, y, letters, row_height,
+                                          col_width, estimator, merged))
+            data = data.encode('utf-8')
+            if sheet is not None:
+                cached_blocks.append((zlib.compress(data, 1),
+                                      merges[first_merge:]))
+            yield data
+        yield '</sheetData>'
+
+        merged.flush()
+        if merges:
+            yield '<mergeCells count="{}">'.format(len(merges))
+            for coord in merges:
+                yield '<mergeCell ref="{}"/>'.format(coord)
+            yield '</mergeCells>'
+        yield ('<pageMargins left="0.75" right="0.75" top="1" bottom="1" '
+               'header="0.5" footer="0.5"/></worksheet>')
+
+        if sheet is not None:
+            sheet.col_width = col_width
+            sheet.blocks = cached_blocks
+            if reused:
+                table.changes.clear(table, dirty)
+            else:
+                table.track_changes()
+
+    def _rows_xml(self, rows, x, y, letters, row_height, col_width, estimator,
+                  merged):
+        strings, styles = self._strings, self._styles
+        parts = []
+        for row_num, row in rows:
+            excel_x = x + row_num
+            if row_num < len(row_height):
+                height = row_height[row_num]
+            else:
+                height = estimator.measure_row(row, row_num, col_width)
+
+            cells = []
+            for col_num in range(len(letters)):
+                cell = row[col_num]
+                if cell is None:
+                    continue
+
+                merged.add(col_num, excel_x, y + col_num, cell)
+
+                value = cell.value
+                value_type = type(value)
+                if value_type in _NUMBER_TYPES:
+                    cells.append('<c r="{}{}"{} t="n"><v>{}</v></c>'.format(
+                        letters[col_num], excel_x,
+                        styles.attribute(cell.style), _number(value)))
+                elif isinstance(value, six.string_types):
+                    if isinstance(value, bytes):
+                        value = value.decode('utf-8')
+                    if value.startswith('=') and len(value) > 1:
+                        cells.append('<c r="{}{}"{}><f>{}</f><v/></c>'.format(
+                            letters[col_num], excel_x,
+                            styles.attribute(cell.style), escape(value[1:])))
+                    else:
+                        cells.append('<c r="{}{}"{} t="s"><v>{}</v></c>'
+                                     .format(letters[col_num], excel_x,
+                                             styles.attribute(cell.style),
+                                             strings.index(value)))
+                elif value is None:
+                    if cell.style is not None:
+                        cells.append('<c r="{}{}"{}/>'.format(
+                            letters[col_num], excel_x,
+                            styles.attribute(cell.style)))
+                elif value_type is bool:
+                    cells.append('<c r="{}{}"{} t="b"><v>{:d}</v></c>'.format(
+                        letters[col_num], excel_x,
+                        styles.attribute(cell.style), value))
+                else:
+                    number_format = _time_format(value)
+                    cells.append('<c r="{}{}"{} t="n"><v>{}</v></c>'.format(
+                        letters[col_num], excel_x,
+                        styles.attribute(cell.style, number_format),
+                        _number(to_excel(value))))
+
+            if height is not None:
+                parts.append('<row r="{}" ht="{}" customHeight="1">'.format(
+                    excel_x, _number(height)))
+            elif cells:
+                parts.append('<row r="{}">'.format(excel_x))
+            else:
+                continue
+            parts.extend(cells)
+            parts.append('</row>')
+        return parts
+
+
+def _time_format(value):
+    number_format = TIME_FORMATS.get(type(value))
+    if number_format is None:
+        raise ValueError('Cannot convert {0!r} to Excel'.format(value))
+    return number_format
@@ -2,10 +2,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from openpyxl import Workbook
+import decimal
+import functools
+import gc
+import json
+import pickle
+import weakref
+
+import pytest
+from openpyxl import Workbook, load_workbook
 
 from tablereport import *
-from tablereport.shortcut import write_to_excel
+from tablereport import rows
+from tablereport.shortcut import write_to_csv, write_to_excel, write_workbook
 
 
 def test_table_initialize():
@@ -28,6 +37,51 @@ def test_initialize_table_with_empty_headers_and_empty_body():
     assert table.height == 0
 
 
+def test_initialize_table_without_copying_body(monkeypatch):
+    # bodies larger than the blocks of the row store
+    monkeypatch.setattr(rows, '_BLOCK_SIZE', 1)
+
+    def build(copy):
+        header = [['header1', 'header2']]
+        body = [[1, 2], [1, 3], [2, 4]]
+        table = Table(header=header, body=body, copy=copy)
+        if copy:
+            assert body[0] is not table[1] and body[0] == [1, 2]
+        else:
+            assert body[0] is table[1] and body[0] == [Cell(1), Cell(2)]
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas.group().merge().left.summary(label_span=1, label='total')
+        table.summary(label_span=1, label='total')
+        return table, header, body
+
+    table, header, body = build(copy=True)
+    assert header == [['header1', 'header2']]
+    assert body == [[1, 2], [1, 3], [2, 4]] and table.height == 7
+    shared, header, body = build(copy=False)
+    assert shared.data == table.data
+    assert shared.data == header + body
+
+
+def test_row_store_is_equivalent_to_list(monkeypatch):
+    monkeypatch.setattr(rows, '_BLOCK_SIZE', 2)
+    expected = list(range(10))
+    store = rows.RowStore([list(range(3)), list(range(3, 10))])
+    for row_num in (5, 0, 12, 9, -1, 3, 5):
+        expected.insert(row_num, 'row%d' % row_num)
+        store.insert(row_num, 'row%d' % row_num)
+    for row_num in (0, 7, -1, 4, 6):
+        del expected[row_num]
+        del store[row_num]
+    expected[3:7] = expected[3:7][::-1]
+    store.reorder_rows(3, [3, 2, 1, 0])
+
+    assert store == expected and len(store) == len(expected)
+    assert [store[row_num] for row_num in range(-len(store), len(store))] \
+        == expected + expected
+    assert store[2:9] == expected[2:9]
+    assert len(store.blocks) > 2
+
+
 def test_column_selector_select_right_area_of_area():
     table = Table(body=[[1, 2, 3, ], [4, 5, 6], [7, 8, 9]])
     area = Area(table, 3, 3, (0, 0))
@@ -124,6 +178,78 @@ def test_column_selector_could_group_selected_areas():
     assert areas[1].position == (4, 0)
 
 
+def test_group_area_by_key():
+    table = Table(header=[['header1', 'header2']],
+                  body=[[1, 2], [3, 2], [2, 3], [4, 4], [5, 4]])
+    area = table.body.select(ColumnSelector(lambda col: col == 1)).one()
+
+    areas = area.group(key=lambda cell: cell.value % 2)
+    assert [(a.position, a.height) for a in areas] == [((1, 0), 2),
+                                                     ((3, 0), 2),
+                                                     ((5, 0), 1)]
+
+
+def test_group_presorted_area():
+    table = Table(body=[[1], [1], [1], [2], [3], [3], [3], [3], [3]])
+    areas = table.body.group(presorted=True)
+
+    assert [(a.position, a.height) for a in areas] == [((0, 0), 3),
+                                                     ((3, 0), 1),
+                                                     ((4, 0), 5)]
+    assert [(a.position, a.height) for a in areas] == [
+        (a.position, a.height) for a in table.body.group()]
+
+
+def test_group_unsorted_area():
+    def body():
+        return [['Two', 'A', 1], ['One', 'B', 2], ['Two', 'A', 3],
+                ['One', 'A', 4], ['One', 'B', 5]]
+
+    for columnar in (False, True):
+        table = Table(header=[['H1', 'H2', 'H3']], body=body(),
+                      columnar=columnar)
+        table[3][2].style = {'font_weight': 'blod'}
+        areas = table.body.select(
+            ColumnSelector(lambda col: col == 1, width=2)).one()
+        groups = areas.group(sort='hash')
+        assert [[cell.value for cell in row] for row in table.body] == [
+            ['Two', 'A', 1], ['Two', 'A', 3], ['One', 'B', 2],
+            ['One', 'B', 5], ['One', 'A', 4]]
+        assert table[2][2].style == {'font_weight': 'blod'}
+        assert [(a.position, a.width, a.height) for a in groups] == [
+            ((1, 0), 2, 2), ((3, 0), 2, 2), ((5, 0), 2, 1)]
+
+        table = Table(body=body(), columnar=columnar)
+        groups = table.body.select(
+            ColumnSelector(lambda col: col == 1)).group(sort=True).merge()
+        assert [[cell and cell.value for cell in row] for row in table] == [
+            ['One', 'B', 2], [None, 'A', 4], [None, 'B', 5],
+            ['Two', 'A', 1], [None, 'A', 3]]
+        assert [a.height for a in groups] == [3, 2]
+
+
+def test_sorting_groups_keeps_merged_cells_and_total_rows():
+    table = Table(body=[['One', 'B', 2], ['One', 'A', 4], ['Two', 'B', 1],
+                        ['Two', 'A', 3]])
+    column = table.body.select(ColumnSelector(lambda col: col == 1)).one()
+    groups = column.group().merge()
+    expected = [[cell and cell.value for cell in row] for row in table]
+    inner = groups[0].left.select(ColumnSelector(lambda col: col == 1))
+    with pytest.raises(ValueError):
+        inner.group(sort=True)
+    assert [[cell and cell.value for cell in row] for row in table] == \
+        expected
+
+    table = Table(body=[[2, 1], [1, 2]])
+    table.summary(label_span=1, label='total')
+    with pytest.raises(ValueError):
+        table.select(ColumnSelector(lambda col: col == 1)).group(sort=True)
+
+    table = Table(body=[[2], [None], [1]])
+    table.body.select(ColumnSelector(lambda col: col == 1)).group(sort=True)
+    assert [row[0] and row[0].value for row in table] == [None, 1, 2]
+
+
 def test_modify_area_is_equivalent_to_modify_table():
     table = Table(header=[['header1', 'header2', 'header3']],
                   body=[[1, 2, 3], [4, 5, 6], [7, 8, 9]])
@@ -278,6 +404,147 @@ def test_add_nested_summary_will_modify_table():
     assert table.height == 9
 
 
+def test_summary_skips_total_row_nums():
+    table = Table(body=[[1, 2], [1, 3], [2, 4]])
+    table.total_row_nums.add(1)
+    table.summary(label_span=1, label='total')
+
+    assert table[3] == ['total', 6]
+    assert table.total_row_nums == {1, 3}
+    table.total_row_nums.discard(1)
+    table.total_row_nums |= {0}
+    assert sorted(table.total_row_nums) == [0, 3]
+
+
+def test_table_only_tracks_live_areas():
+    table = Table(header=[['header1', 'header2', 'header3']],
+                  body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4], [2, 4, 5]])
+    for _ in range(10):
+        table.body.select(RowSelector(lambda row: True))
+    areas = table.body.select(ColumnSelector(lambda col: col == 1))
+
+    tracked = list(table.areas)
+    assert len(tracked) == 3
+    assert all(any(area is other for other in tracked)
+               for area in [table.header, table.body, areas[0]])
+
+
+def test_add_summary_below_will_grow_merged_cells_of_released_areas():
+    table = Table(header=[['header1', 'header2', 'header3']],
+                  body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4], [2, 4, 5]])
+    table.body.select(ColumnSelector(lambda col: col == 1)).group().merge()
+    areas = Areas([Area(table, 2, 3, (1, 1)), Area(table, 2, 2, (4, 1))])
+    areas.summary(label_span=1, label='total')
+
+    assert table[1][0] == Cell(1, height=4)
+    assert table[5][0] == Cell(2, height=3)
+
+
+def test_add_summary_below_drops_unmerged_cells():
+    table = Table(header=[['header1', 'header2', 'header3']],
+                  body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4], [2, 4, 5]])
+    table.body.select(ColumnSelector(lambda col: col == 1)).group().merge()
+    assert table.areas.spans() == [(1, 3, 0, 1), (4, 2, 0, 1)]
+
+    table[1][0].height = 1
+    table[4][0] = Cell(2)
+    table.body.select(RowSelector(lambda row: row in (1, 4))).summary(
+        label_span=1, label='total')
+
+    assert table.areas.spans() == []
+    assert table[1][0] == Cell(1)
+    assert table[5][0] == Cell(2)
+
+
+def test_batch_summary_is_equivalent_to_sequential_summary():
+    def build(batch):
+        table = Table(header=[['header1', 'header2', 'header3']],
+                      body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4],
+                            [2, 4, 5]])
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas = areas.group().merge()
+        if batch:
+            with table.batch():
+                for area in areas.left:
+                    area.summary(label_span=1, label='total')
+                table.summary(label_span=2, label='total')
+                assert table[4][1] == Cell('total')
+                assert table[8][2] == Cell(21)
+                assert table[3:5] == [table[3], table[4]]
+                assert table[-2:][1] == table[8]
+        else:
+            for area in areas.left:
+                area.summary(label_span=1, label='total')
+            table.summary(label_span=2, label='total')
+        return list(table), [(area.position, area.height) for area in areas]
+
+    assert build(batch=True) == build(batch=False)
+
+
+def test_add_summary_with_aggregate():
+    for columnar in (False, True):
+        table = Table(header=[['header1', 'header2', 'header3']],
+                      body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4],
+                            [2, 4, 6]],
+                      columnar=columnar)
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas.group().merge().left.summary(label_span=1, label='max',
+                                           aggregate='max')
+        table.summary(label_span=1, label='mean', aggregate='mean')
+        table.summary(label_span=1, label='count', aggregate='count')
+        table.summary(label_span=2, label='range',
+                      aggregate=lambda values: max(values) - min(values))
+
+        assert table.data == [['header1', 'header2', 'header3'],
+                              [1, 2, 3], [None, 2, 4], [None, 3, 5],
+                              [None, 'max', 5],
+                              [2, 3, 4], [None, 4, 6], [None, 'max', 6],
+                              ['mean', 2.8, 4.4],
+                              ['count', 5, 5],
+                              ['range', None, 3]]
+
+
+def test_profile_operations():
+    table = Table(header=[['header1', 'header2', 'header3']],
+                  body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4]])
+    names = []
+
+    def hook(name, record):
+        names.append(name)
+
+    add_hook(hook)
+    with Profile() as profile:
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas.group().merge().left.summary(label_span=1, label='total')
+    remove_hook(hook)
+    table.summary(label_span=1, label='total')
+
+    stats = profile.as_dict()
+    assert stats['Area.select']['cells'] == 12
+    assert stats['Areas.group']['areas'] == 2
+    assert stats['Area.merge']['calls'] == 2
+    assert stats['Areas.summary']['rows'] == 2
+    assert 'Table.summary' not in stats
+    assert sorted(set(names)) == sorted(stats)
+    assert json.loads(profile.to_json()) == stats
+
+
+def test_profile_counts_the_cells_of_lazy_tables(tmpdir):
+    def build():
+        return Table.from_iterable(iter([[1, 2], [3, 4], [5, 6]]),
+                                   header=[['header1', 'header2']],
+                                   chunk_size=2)
+
+    filename = str(tmpdir.join('lazy.xlsx'))
+    with Profile() as profile:
+        write_to_excel(filename, build(), write_only=True)
+    assert profile.as_dict()['WorkSheetWriter.write']['cells'] == 8
+
+    lazy = build()
+    write_to_excel(filename, lazy, write_only=True)
+    assert lazy._rows_iterated == 0
+
+
 def test_each_elem_in_table_is_encapsulated_as_cell():
     table = Table(body=[[1, 2, ], [4, 5, ]])
 
@@ -295,6 +562,18 @@ def test_set_cell_width_when_initialize_table():
                            [Cell(1), Cell(2)]]
 
 
+def test_set_cell_height_and_width_when_initialize_table():
+    table = Table(header=[['test', None, 'title'], [None, None, None],
+                          ['header1', 'header2', None]],
+                  body=[[1, None, 2], [None, 3, None]])
+    assert list(table) == [[Cell('test', width=2, height=2), None,
+                            Cell('title', height=3)],
+                           [None, None, None],
+                           [Cell('header1'), Cell('header2', height=2), None],
+                           [Cell(1, height=2), None, Cell(2, height=2)],
+                           [None, Cell(3), None]]
+
+
 def test_iter_table_will_get_cell_list():
     table = Table(body=[[1, 2, ], [4, 5, ]])
     cells = [[Cell(1), Cell(2)], [Cell(4), Cell(5)]]
@@ -440,6 +719,48 @@ def test_add_nested_summary_will_modify_cell_2():
     ]
 
 
+def test_columnar_table_is_equivalent_to_table():
+    def build(columnar):
+        table = Table(header=[['test', None, None],
+                              ['header1', 'header2', 'header3']],
+                      body=[[1, 2, 3], [1, 2.5, 4], [1, 3, 5], [2, 3, 4],
+                            [2, 4, 5]],
+                      columnar=columnar)
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas.group().merge().left.summary(label_span=1, label='total')
+        table.summary(label_span=2, label='total')
+        return table
+
+    table = build(columnar=True)
+    assert list(table) == list(build(columnar=False))
+    assert table.data == build(columnar=False).data
+
+
+def test_columnar_table_does_not_keep_the_rows_given():
+    class Row(list):
+        pass
+
+    header, body = [Row(['header1', 'header2'])], [Row([1, 2]), Row([3, 4])]
+    rows = [weakref.ref(row) for row in header + body]
+    table = Table(header=header, body=body, columnar=True)
+    assert body == [[1, 2], [3, 4]]
+    del header, body
+    gc.collect()
+    assert all(row() is None for row in rows)
+    assert (table.header.height, table.body.position) == (1, (1, 0))
+
+
+def test_modify_cell_of_columnar_table():
+    style = {'foo': 'bar'}
+    table = Table(body=[[1, 2], [3, 4]], columnar=True)
+    table[0][1].style = style
+    table[1][0].value = 'text'
+    table[1][1] = None
+
+    assert list(table) == [[Cell(1), Cell(2, style=style)],
+                           [Cell('text'), None]]
+
+
 def test_set_global_style_on_table():
     style = {}
     table = Table(
@@ -454,6 +775,50 @@ def test_set_global_style_on_table():
                 assert id(cell.style) == id(style)
 
 
+def test_cells_share_the_default_style():
+    table = Table(body=[[1, 2], [3, 4]])
+    styles = set(id(cell.style) for row in table for cell in row)
+
+    assert len(styles) == 1
+    assert not hasattr(table[0][0], '__dict__')
+    assert not hasattr(table.body, '__dict__')
+
+
+def test_cells_only_store_the_spans_of_merged_cells():
+    cell = Cell(1)
+    assert (cell.width, cell.height) == (1, 1)
+    assert cell._span is None
+
+    cell.height = 3
+    assert (cell.width, cell.height) == (1, 3)
+    assert cell == Cell(1, height=3)
+    cell.height = 1
+    assert cell._span is None
+
+
+def test_style_extends_another_style():
+    title_style = Style({'font_weight': 'blod', 'font_size': 14})
+    red_title_style = Style({'background_color': 'ffff0000'},
+                            extend=title_style)
+
+    assert red_title_style.parent is title_style
+    assert red_title_style == dict(title_style, background_color='ffff0000')
+    assert red_title_style['font_size'] == 14
+    assert red_title_style.get('width') == 'auto'
+    assert Style({'foo': 'bar'}, extend={'font_size': 10}) == {
+        'foo': 'bar', 'font_size': 10}
+
+    copied = Style({'background_color': 'ffff0000'}, extend=dict(title_style))
+    assert copied == red_title_style and copied is not red_title_style
+    assert copied.id == red_title_style.id and copied.id != title_style.id
+    assert len({copied, red_title_style, title_style}) == 2
+    assert pickle.loads(pickle.dumps(copied)) == copied
+    with pytest.raises(TypeError):
+        title_style['font_size'] = 16
+    with pytest.raises(AttributeError):
+        red_title_style.parent = None
+
+
 def test_set_style_of_headers():
     table_style = Style()
     title_style = Style()
@@ -547,6 +912,89 @@ def test_cell_selector():
     assert area[4][1].style == {'foo': 'bar'}
 
 
+def test_selectors_match_cells_row_by_row():
+    visited = []
+
+    class NegativeSelector(Selector):
+        kind = 'cell'
+
+        def match(self, cell):
+            visited.append(cell.value)
+            return cell.value < 0
+
+    table = Table(body=[[1, -2], [-3, 4]])
+    cells = table.body.select(NegativeSelector())
+    assert visited == [1, -2, -3, 4]
+    assert [cell.value for cell in cells] == [-2, -3]
+
+    del visited[:]
+    table.body.select(CellSelector(lambda cell: visited.append(cell.value)))
+    assert visited == [1, -2, -3, 4]
+
+
+def test_vectorized_and_combined_selectors():
+    for columnar in (False, True):
+        table = Table(header=[['HEADER1', 'HEADER2', 'HEADER3']],
+                      body=[[1, -2, 3], [-4, 5, 6], [7, -8, -9], [10, 11, 12]],
+                      columnar=columnar)
+        negative = CellSelector(lambda values: [value < 0 for value in values],
+                                vectorized=True)
+        cells = table.body.select(negative)
+        assert [cell.value for cell in cells] == [-2, -4, -8, -9]
+
+        selected = table.body.select(negative, compact=True)
+        assert selected.runs == [(2, 0, 1, 1, 1, 1), (1, 1, 1, 1, 2, 2),
+                                 (3, 2, 1, 1, 1, 1)]
+        selected.set_style({'foo': 'bar'})
+        assert [cell for cell in table.body.select(
+            CellSelector(lambda cell: cell.style == {'foo': 'bar'}))] == cells
+
+        odd = RowSelector(lambda rows: [row % 2 for row in rows],
+                          vectorized=True)
+        rows = table.body.select(odd & ~RowSelector(lambda row: row == 3))
+        assert [area.position for area in rows] == [(1, 0)]
+        selected = table.select(odd | RowSelector(lambda row: row == 2),
+                                compact=True)
+        assert selected.runs == [(0, 0, 3, 1, 3, 1), (4, 0, 3, 1, 1, 1)]
+        assert len(selected) == 4
+        assert [area.position for area in selected.to_areas()] == \
+            [(0, 0), (1, 0), (2, 0), (4, 0)]
+
+        with pytest.raises(ValueError):
+            odd & ColumnSelector(lambda col: col == 1)
+
+
+def test_area_set_is_equivalent_to_areas():
+    def build():
+        return Table(header=[['HEADER1', 'HEADER2', 'HEADER3', 'HEADER4']],
+                     body=[['One', 'A', 1, 2], ['One', 'A', 2, 3],
+                           ['One', 'B', 3, 4], ['Two', 'A', 1, 2],
+                           ['Two', 'B', 2, 3]])
+
+    def report(compact):
+        table = build()
+        areas = table.body.select(ColumnSelector(lambda col: col == 1),
+                                  compact=compact)
+        areas.group().merge().left.summary(label_span=1, label='total')
+        table.summary(label_span=2, label='all')
+        return table
+
+    def striped(compact):
+        table = build()
+        areas = table.body.select(RowSelector(lambda row: row % 2 == 1),
+                                  compact=compact)
+        areas.summary(label_span=2, label='sub')
+        areas.set_style({'foo': 'bar'})
+        return table, areas
+
+    assert report(True).data == report(False).data
+
+    table, areas = striped(True)
+    assert areas.runs == [(1, 0, 4, 2, 3, 3)]
+    assert len(areas) == 3
+    assert table.data == striped(False)[0].data
+
+
 def test_add_horizontal_summary_will_modify_cell():
     table = Table(body=[['One', 'A', 1, 2],
                         ['One', 'A', 2, 3],
@@ -567,6 +1015,72 @@ def test_add_horizontal_summary_will_modify_cell():
         [Cell('Two'), Cell('B'), Cell(2), Cell(3), Cell(5, style=style)]]
 
 
+def test_group_by_is_equivalent_to_summaries():
+    body = [['Two', 'A', 'x', 1, 2],
+            ['One', 'B', 'x', 3, 4],
+            ['One', 'A', 'y', 2, 3],
+            ['Two', 'B', 'z', 2, 3],
+            ['One', 'A', 'x', 1, 2],
+            ['Two', 'B', 'y', 5, 1]]
+
+    table = Table(header=[['H1', 'H2', 'H3', 'H4', 'H5']],
+                  body=sorted([list(row) for row in body],
+                              key=lambda row: row[:2]))
+    keys = table.body.select(ColumnSelector(lambda col: col == 1))
+    groups = keys.group().merge()
+    subgroups = Areas()
+    for area in groups:
+        subgroups.extend(area.left.select(
+            ColumnSelector(lambda col: col == 1)).group().merge())
+    subgroups.left.summary(label_span=1, label='Total')
+    groups.left.summary(label_span=2, label='Total')
+    table.summary(label_span=3, label='Total')
+
+    grouped = Table.group_by(body, keys=2, label_span=3,
+                             header=[['H1', 'H2', 'H3', 'H4', 'H5']])
+    assert grouped.data == table.data
+    assert grouped.total_row_nums == table.total_row_nums
+    assert grouped.areas.spans() == table.areas.spans()
+    assert grouped.body.height == table.body.height == 13
+    # the subtotals of the groups are not counted twice
+    assert [cell.value for cell in grouped[6][3:]] == [6, 9]
+    assert [cell.value for cell in grouped[12][3:]] == [8, 6]
+    assert [cell.value for cell in grouped[13][3:]] == [14, 15]
+
+    grouped = Table.group_by(body, aggregate=['max', 'count'], sort='hash',
+                             subtotal_levels=[], total=False)
+    assert [[cell and cell.value for cell in row] for row in grouped] == [
+        ['Two', 'A', 'x', 1, 2],
+        [None, 'B', 'z', 2, 3],
+        [None, 'B', 'y', 5, 1],
+        ['One', 'B', 'x', 3, 4],
+        [None, 'A', 'y', 2, 3],
+        [None, 'A', 'x', 1, 2]]
+    assert grouped[0][0].height == grouped[3][0].height == 3
+
+
+def test_group_by_wraps_rows_as_table():
+    style = Style({'font_weight': 'blod'})
+    grouped = Table.group_by([[('B', style), 'x', 1, 2],
+                              ['A', ('y', style), 2, None],
+                              ['B', 'z', 3, 4]], label_span=2)
+
+    assert [[cell and cell.value for cell in row] for row in grouped] == [
+        ['A', 'y', 2, None],
+        [None, 'Total', 2, 0],
+        ['B', 'x', 1, 2],
+        [None, 'z', 3, 4],
+        [None, 'Total', 4, 6],
+        ['Total', None, 6, 6]]
+    assert grouped[2][0].style is grouped[0][1].style is style
+    assert grouped[2][0].height == 3
+    # the None merges the cell on its left, which is only summarized once
+    assert grouped[0][2].width == 2
+
+    with pytest.raises(ValueError):
+        Table.group_by([[None, 1], ['A', 2]])
+
+
 def test_excel_writer():
     table = Table(header=[['header1', 'header2', 'header3']],
                   body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4], [2, 4, 5]])
@@ -588,6 +1102,379 @@ def test_excel_writer():
     wb.save('1.xlsx')
 
 
+def test_excel_writer_shares_styles_between_cells_and_sheets():
+    header_style = Style({
+        'background_color': 'FF87CEFA',
+        'font_weight': 'blod'
+    })
+    table = Table(header=[[('header1', header_style),
+                           ('header2', header_style)]],
+                  body=[[1, 2], [3, 4]])
+
+    wb = Workbook()
+    ws1 = wb.active
+    ws2 = wb.create_sheet()
+    WorkSheetWriter.write(ws1, table, (0, 0))
+    WorkSheetWriter.write(ws2, table, (1, 1))
+
+    assert ws1['A1'].font.b
+    assert ws1['A1'].fill.start_color.rgb == 'FF87CEFA'
+    assert ws1['A1'].style_id == ws1['B1'].style_id == ws2['B2'].style_id
+    assert not ws1['A2'].font.b
+    assert ws1['A2'].style_id == ws1['B3'].style_id == ws2['C4'].style_id
+    assert ws1['A1'].style_id != ws1['A2'].style_id
+
+
+def test_write_only_excel_is_equivalent_to_excel(tmpdir):
+    title_style = Style({'background_color': 'FF87CEFA', 'font_size': 15})
+    table = Table(header=[[('TEST', title_style), None, None],
+                          ['header1', 'header2', 'header3']],
+                  body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4],
+                        [2, 4, 5]])
+    areas = table.body.select(ColumnSelector(lambda col: col == 1))
+    areas.group().merge().left.summary(label_span=1, label='total')
+
+    write_to_excel(str(tmpdir.join('normal.xlsx')), table, (1, 2))
+    write_to_excel(str(tmpdir.join('write_only.xlsx')), table, (1, 2),
+                   write_only=True)
+
+    normal = load_workbook(str(tmpdir.join('normal.xlsx'))).active
+    write_only = load_workbook(str(tmpdir.join('write_only.xlsx'))).active
+    assert [[cell.value for cell in row] for row in normal.iter_rows()] == \
+        [[cell.value for cell in row] for row in write_only.iter_rows()]
+    assert [[cell.fill.start_color.rgb for cell in row]
+            for row in normal.iter_rows()] == \
+        [[cell.fill.start_color.rgb for cell in row]
+         for row in write_only.iter_rows()]
+    assert sorted(map(str, normal.merged_cells.ranges)) == \
+        sorted(map(str, write_only.merged_cells.ranges)) == \
+        ['C2:E2', 'C4:C7', 'C8:C10']
+    assert normal.row_dimensions[2].height == \
+        write_only.row_dimensions[2].height == 23
+    assert normal.column_dimensions['D'].width == \
+        write_only.column_dimensions['D'].width
+
+
+def test_xml_engine_is_equivalent_to_openpyxl(tmpdir):
+    def build():
+        title_style = Style({'background_color': 'FF87CEFA', 'font_size': 15,
+                             'font_weight': 'blod', 'height': 'auto'})
+        table = Table(header=[[('TEST', title_style), None, None],
+                              [True, ' <&> ', '=B3+1']],
+                      body=[[1, 2.5, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4]])
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas.group().merge().left.summary(label_span=1, label='total')
+        return table
+
+    write_to_excel(str(tmpdir.join('openpyxl.xlsx')), build(), (1, 2))
+    write_to_excel(str(tmpdir.join('xml.xlsx')), build(), (1, 2),
+                   engine='xml')
+    write_to_excel(str(tmpdir.join('xml2.xlsx')), build(), (1, 2),
+                   engine='xml')
+
+    expected = load_workbook(str(tmpdir.join('openpyxl.xlsx'))).active
+    actual = load_workbook(str(tmpdir.join('xml.xlsx'))).active
+    assert [[cell.value for cell in row] for row in expected.iter_rows()] == \
+        [[cell.value for cell in row] for row in actual.iter_rows()]
+    for name in ('font', 'fill', 'border', 'alignment'):
+        assert [[repr(getattr(cell, name)) for cell in row]
+                for row in expected.iter_rows()] == \
+            [[repr(getattr(cell, name)) for cell in row]
+             for row in actual.iter_rows()]
+    assert sorted(map(str, expected.merged_cells.ranges)) == \
+        sorted(map(str, actual.merged_cells.ranges))
+    assert expected.row_dimensions[2].height == \
+        actual.row_dimensions[2].height == 23
+    assert tmpdir.join('xml.xlsx').read_binary() == \
+        tmpdir.join('xml2.xlsx').read_binary()
+
+
+def test_xml_writer_does_not_mix_up_freed_styles(tmpdir):
+    filename = str(tmpdir.join('colors.xlsx'))
+    colors = ['ff{:06x}'.format(0x10101 * num) for num in range(30)]
+    with XlsxWriter(filename) as writer:
+        for color in colors:
+            # the style and table of each sheet are freed before the next one
+            writer.add_sheet(Table(body=[[(1, Style(
+                {'background_color': color}))]]), title=color)
+            gc.collect()
+
+    workbook = load_workbook(filename)
+    assert [workbook[color]['A1'].fill.start_color.rgb.lower()
+            for color in colors] == colors
+
+
+def build_region_table(region):
+    title_style = Style({'background_color': 'FF87CEFA', 'font_size': 15})
+    table = Table(header=[[(region, title_style), None, None],
+                          ['header1', 'header2', 'header3']],
+                  body=[[1, 2, 3], [1, 2, 4], [1, 3, 5], [2, 3, 4]])
+    areas = table.body.select(ColumnSelector(lambda col: col == 1))
+    areas.group().merge().left.summary(label_span=1, label='total')
+    return table
+
+
+def build_invalid_table(region):
+    raise ValueError(region)
+
+
+def test_write_workbook_stops_on_errors(tmpdir):
+    with pytest.raises(ValueError):
+        write_workbook(str(tmpdir.join('regions.xlsx')), [
+            ('north', functools.partial(build_invalid_table, 'North'), (0, 0)),
+            ('south', functools.partial(build_region_table, 'South'), (0, 0)),
+        ], processes=2)
+
+
+def test_write_tables_into_workbook(tmpdir):
+    filename = str(tmpdir.join('regions.xlsx'))
+    write_workbook(filename, [
+        ('north', functools.partial(build_region_table, 'North'), (0, 0)),
+        ('south', functools.partial(build_region_table, 'South'), (1, 2)),
+        ('east', build_region_table('East'), (0, 0)),
+    ], processes=2)
+    write_to_excel(str(tmpdir.join('south.xlsx')),
+                   build_region_table('South'), (1, 2))
+
+    workbook = load_workbook(filename)
+    assert workbook.sheetnames == ['north', 'south', 'east']
+    assert workbook['north']['A1'].value == 'North'
+    assert workbook['east']['A1'].value == 'East'
+
+    expected = load_workbook(str(tmpdir.join('south.xlsx'))).active
+    actual = workbook['south']
+    assert [[cell.value for cell in row] for row in expected.iter_rows()] == \
+        [[cell.value for cell in row] for row in actual.iter_rows()]
+    assert [[cell.fill.start_color.rgb for cell in row]
+            for row in expected.iter_rows()] == \
+        [[cell.fill.start_color.rgb for cell in row]
+         for row in actual.iter_rows()]
+    assert sorted(map(str, expected.merged_cells.ranges)) == \
+        sorted(map(str, actual.merged_cells.ranges))
+    assert expected.row_dimensions[2].height == \
+        actual.row_dimensions[2].height
+
+
+def test_lazy_table_is_equivalent_to_table(tmpdir):
+    class Cursor(object):
+        def __init__(self, rows):
+            self.rows = list(rows)
+
+        def fetchmany(self, size):
+            rows, self.rows = self.rows[:size], self.rows[size:]
+            return rows
+
+    def header():
+        return [['TEST', None, None], ['header1', 'header2', 'header3']]
+
+    def body():
+        return [[1, 2, 3], [None, 2, 4], [None, None, 5], [2, 3, 4],
+                [None, 4, 5]]
+
+    table = Table(header=header(), body=body())
+
+    lazy = Table.from_iterable(iter(body()), header=header(), chunk_size=2)
+    assert list(lazy.iter_rows()) == list(table.iter_rows())
+
+    write_to_excel(str(tmpdir.join('table.xlsx')), table)
+    for write_only in (False, True):
+        lazy = Table.from_iterable(Cursor(body()), header=header(),
+                                   chunk_size=2)
+        filename = str(tmpdir.join('lazy.xlsx'))
+        write_to_excel(filename, lazy, write_only=write_only)
+
+        expected = load_workbook(str(tmpdir.join('table.xlsx'))).active
+        actual = load_workbook(filename).active
+        assert [[cell.value for cell in row]
+                for row in expected.iter_rows()] == \
+            [[cell.value for cell in row] for row in actual.iter_rows()]
+        assert sorted(map(str, expected.merged_cells.ranges)) == \
+            sorted(map(str, actual.merged_cells.ranges)) == \
+            ['A1:C1', 'A3:A5', 'A6:A7', 'B4:B5']
+
+
+def test_csv_writer_flattens_merged_cells(tmpdir):
+    def body():
+        return [[1, 2, 3], [None, 2, 4], [None, None, 5]]
+
+    expected = {
+        'repeat': 'TEST,TEST,TEST\r\n1,2,3\r\n1,2,4\r\n1,2,5\r\n',
+        'first': 'TEST,,\r\n1,2,3\r\n,2,4\r\n,,5\r\n',
+        'blank': ',,\r\n,2,3\r\n,,4\r\n,,5\r\n',
+    }
+    for merged, text in expected.items():
+        filename = str(tmpdir.join('table.csv'))
+        table = Table(header=[['TEST', None, None]], body=body())
+        write_to_csv(filename, table, merged=merged)
+        with open(filename, 'rb') as file:
+            assert file.read().decode('utf-8') == text
+
+    lazy = Table.from_iterable(iter(body()), header=[['TEST', None, None]],
+                               chunk_size=1)
+    write_to_csv(filename, lazy, dialect='excel-tab')
+    with open(filename, 'rb') as file:
+        assert file.read().decode('utf-8') == \
+            expected['repeat'].replace(',', '\t')
+
+
+def test_incremental_export_is_equivalent_to_full_export(tmpdir):
+    def build():
+        return Table(header=[['HEADER1', 'HEADER2', 'HEADER3']],
+                     body=[['One', 1, 2], ['One', 2, 3], ['Two', 1, 2]],
+                     style={'width': 'auto'})
+
+    def modify(table):
+        table[1][2].value = 12345678901234
+        table[3][1].style = {'font_weight': 'blod'}
+        areas = table.body.select(ColumnSelector(lambda col: col == 1))
+        areas.group().merge().left.summary(label_span=1, label='total')
+
+    def dump(filename):
+        worksheet = load_workbook(filename).active
+        return ([[(cell.value, cell.font.b) for cell in row]
+                 for row in worksheet.iter_rows()],
+                sorted(map(str, worksheet.merged_cells.ranges)),
+                sorted((key, dimension.width) for key, dimension
+                       in worksheet.column_dimensions.items()))
+
+    table = build()
+    filename = str(tmpdir.join('incremental.xlsx'))
+    write_to_excel(filename, table, incremental=True)
+    assert not table.changes
+    modify(table)
+    assert table.changes.dirty_rows(table) == [1, 2, 3, 4, 5]
+    write_to_excel(filename, table, incremental=True)
+    assert not table.changes
+
+    expected = build()
+    modify(expected)
+    write_to_excel(str(tmpdir.join('full.xlsx')), expected)
+    assert dump(filename) == dump(str(tmpdir.join('full.xlsx')))
+
+    # patch a worksheet of openpyxl
+    table = build()
+    workbook = Workbook()
+    WorkSheetWriter.write(workbook.active, table, (1, 0))
+    table.track_changes()
+    modify(table)
+    WorkSheetWriter.patch(workbook.active, table, (1, 0))
+    assert not table.changes
+    workbook.save(filename)
+
+    expected_table = build()
+    modify(expected_table)
+    expected = Workbook()
+    WorkSheetWriter.write(expected.active, expected_table,
+                          (1, 0))
+    expected.save(str(tmpdir.join('full.xlsx')))
+    assert dump(filename) == dump(str(tmpdir.join('full.xlsx')))
+
+
+def test_incremental_export_only_compresses_changed_blocks(tmpdir,
+                                                           monkeypatch):
+    from tablereport import shortcut
+    from tablereport.writer import xlsx
+    monkeypatch.setattr(xlsx, '_ROWS_PER_WRITE', 2)
+
+    def build():
+        return Table(header=[['HEADER1', 'HEADER2']],
+                     body=[['One', row_num] for row_num in range(7)])
+
+    def modify(table):
+        table[5][1].value = 42
+        table.body[0][0].style = {'font_weight': 'blod'}
+
+    def dump(filename):
+        return [[(cell.value, cell.font.b) for cell in row]
+                for row in load_workbook(filename).active.iter_rows()]
+
+    table = build()
+    filename = str(tmpdir.join('incremental.xlsx'))
+    write_to_excel(filename, table, incremental=True)
+    sheet = shortcut._caches[table][1].sheets['Sheet']
+    blocks = list(sheet.blocks)
+    modify(table)
+    assert table.changes.dirty_rows(table) == [1, 5]
+    assert pickle.loads(pickle.dumps(table[5][1])) == Cell(42)
+    write_to_excel(filename, table, incremental=True)
+    assert [cached is block for cached, block
+            in zip(sheet.blocks, blocks)] == [False, True, False, True]
+
+    expected = build()
+    modify(expected)
+    write_to_excel(str(tmpdir.join('full.xlsx')), expected)
+    assert dump(filename) == dump(str(tmpdir.join('full.xlsx')))
+
+
+def test_tracked_rows_follow_inserted_rows(tmpdir):
+    table = Table(header=[['HEADER1', 'HEADER2']],
+                  body=[['One', 1], ['One', 2], ['Two', 3]], columnar=False)
+    filename = str(tmpdir.join('incremental.xlsx'))
+    write_to_excel(filename, table, incremental=True)
+    row = table[3]
+    assert table[3] is row
+    column = table.body.select(ColumnSelector(lambda col: col == 1)).one()
+    column.group().merge().summary(label_span=1, label='total')
+    write_to_excel(filename, table, incremental=True)
+    assert table[4] is row
+
+    row[1].value = 'CHANGED'
+    assert table.changes.dirty_rows(table) == [4]
+    write_to_excel(filename, table, incremental=True)
+    values = [[cell.value for cell in excel_row]
+              for excel_row in load_workbook(filename).active.iter_rows()]
+    assert values[4] == ['Two', 'CHANGED']
+    assert values[3] == ['total', 3]
+
+
+def test_dump_and_load_table(tmpdir):
+    table = build_region_table('North')
+    table[2][2].value = decimal.Decimal('2.5')
+    table[3][2].style = {'font_weight': 'blod'}
+
+    filename = str(tmpdir.join('tables.bin'))
+    with open(filename, 'wb') as file:
+        table.dump(file)
+        table.dump(file)
+    with open(filename, 'rb') as file:
+        loaded = Table.load(file)
+        assert Table.load(file).data == loaded.data
+        assert file.read() == b''
+
+    assert loaded.data == table.data
+    assert loaded[2][2].value == decimal.Decimal('2.5')
+    assert loaded[2][1].style is loaded.style is table.style
+    assert loaded.header.position == (0, 0) and loaded.header.height == 2
+    assert loaded.body.position == (2, 0) and loaded.body.height == 6
+    assert loaded.total_row_nums == table.total_row_nums
+    assert loaded.areas.spans() == table.areas.spans() == [(2, 4, 0, 1),
+                                                           (6, 2, 0, 1)]
+
+    loaded.summary(label_span=2, label='total')
+    table.summary(label_span=2, label='total')
+    assert loaded.data == table.data
+
+
+def test_width_estimator():
+    style = {'width': 'auto', 'font_size': 12}
+    table = Table(body=[['ab', '北京'], ['abcdef', 'café'], ['abcdefghij', 1]],
+                  style=style)
+
+    col_width = [None, None]
+    estimator = WidthEstimator()
+    for row_num, row in enumerate(table.iter_rows()):
+        estimator.measure_row(row, row_num, col_width)
+    assert col_width == [20, 9]
+
+    col_width = [None, None]
+    estimator = WidthEstimator(east_asian_width, sample=2)
+    for row_num, row in enumerate(table.iter_rows()):
+        estimator.measure_row(row, row_num, col_width)
+    assert col_width == [12, 8]
+    assert east_asian_width('café') == 4
+    assert estimator.text_width(1) == 1 and estimator.text_width(1.0) == 3
+
+
 # todo: dictnary pool,cell pool etc.
 def test_write_excel_with_style():
     table_style = Style({